@@ -0,0 +1,31 @@
+"""
+Import time of the package modules, measured in a fresh interpreter with
+python -X importtime. The cumulative import time of each module in
+microseconds is stored in the benchmark extra info.
+"""
+import subprocess
+import sys
+import pytest
+
+
+def import_time(module):
+    """Cumulative import time of a module in a new interpreter, in us."""
+
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True)
+    for line in out.stderr.splitlines():
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise ValueError(f"No import time found for {module}")
+
+@pytest.mark.parametrize('module', [
+    'napari_annotation_project',
+    'napari_annotation_project.project',
+    'napari_annotation_project.export',
+    'napari_annotation_project.project_widget'])
+def bench_import(module, benchmark):
+    times = []
+    benchmark.pedantic(lambda: times.append(import_time(module)), rounds=3)
+    benchmark.extra_info['import_time_us'] = min(times)
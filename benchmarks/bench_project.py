@@ -0,0 +1,125 @@
+"""
+Benchmarks of project creation, loading, saving and export, without a
+viewer.
+"""
+import time
+import numpy as np
+import pytest
+import tifffile
+
+from napari_annotation_project import project as pr
+from napari_annotation_project import annotations
+from napari_annotation_project import export
+from napari_annotation_project import statistics
+from napari_annotation_project.manifest import file_stat
+from conftest import IMAGE_SHAPE, N_ROIS
+from synthetic import make_labels, make_rois
+
+ANNOTATION_CODECS = [
+    ('tif', 'none', None), ('tif', 'deflate', None), ('tif', 'deflate', 256),
+    ('tif', 'zstd', None), ('tif', 'zstd', 256),
+    ('zarr', 'none', None), ('zarr', 'deflate', None), ('zarr', 'zstd', None), ('zarr', 'lz4', None),
+]
+
+
+def bench_create_project(param_project, tmp_path, measure):
+    p = param_project
+    measure(pr.create_project, tmp_path.joinpath('project'), p.file_paths,
+            p.channels, p.rois, p.backend)
+
+def bench_load_project(param_project, measure):
+    measure(pr.load_project, param_project.project_path)
+
+def bench_save_parameters(param_project, measure):
+    # alternate_path forces a complete save for the sqlite backend
+    measure(param_project.save_parameters, alternate_path=param_project.project_path)
+
+def bench_roi_update(param_project, measure):
+    file_path = param_project.file_paths[0]
+    rois = param_project.rois[file_path]
+
+    def update_roi():
+        param_project.set_rois(file_path, rois)
+        param_project.save_parameters()
+    measure(update_roi)
+
+@pytest.mark.parametrize('export_format', export.EXPORT_FORMATS)
+def bench_export(image_project, tmp_path, measure, export_format):
+    measure(export.export_project, image_project, tmp_path.joinpath('export'),
+            n_workers=1, export_format=export_format)
+
+def _crop_full_copy(jobs):
+    """Previous export: read full volumes and crop them afterwards."""
+
+    for job in jobs:
+        image = tifffile.imread(job['file_path'])
+        labels = tifffile.imread(job['annotation_path'])
+        for roi in job['rois']:
+            limits = np.array(roi).reshape(4, image.ndim).astype(int)
+            export.crop_roi(image.copy(), limits)
+            export.crop_roi(labels.copy(), limits)
+
+def _crop_lazy(jobs):
+    """Current export: crop memory-mapped or plane-wise read data."""
+
+    for job in jobs:
+        image = export.open_array(job['file_path'])
+        labels = export.open_array(job['annotation_path'])
+        for roi in job['rois']:
+            limits = np.array(roi).reshape(4, image.ndim).astype(int)
+            export.crop_roi(image, limits)
+            export.crop_roi(labels, limits)
+        export.close_array(image)
+        export.close_array(labels)
+
+@pytest.mark.parametrize('crop', [_crop_full_copy, _crop_lazy], ids=['full_copy', 'lazy'])
+def bench_export_crop_stack(stack_project, measure, crop):
+    # peak memory of cropping rois out of 3D stacks, see BENCH_STACK_SHAPE
+    measure(crop, export.export_jobs(stack_project))
+
+def bench_iter_roi_crops(image_project, measure):
+    measure(lambda: sum(1 for _ in pr.iter_roi_crops(image_project)))
+
+def bench_export_incremental(image_project, tmp_path, measure):
+    # re-export of an unchanged project, after a first complete export
+    export_folder = tmp_path.joinpath('export')
+    export.export_project(image_project, export_folder, n_workers=1, incremental=True)
+    measure(export.export_project, image_project, export_folder, n_workers=1, incremental=True)
+
+@pytest.mark.parametrize('use_cache', [False, True])
+def bench_label_statistics(image_project, measure, use_cache):
+    statistics.label_statistics(image_project, n_workers=1)
+    measure(statistics.label_statistics, image_project, n_workers=1, use_cache=use_cache)
+
+@pytest.mark.parametrize('annotation_format,compression,tile', ANNOTATION_CODECS)
+def bench_annotation_codec(tmp_path, benchmark, annotation_format, compression, tile):
+    try:
+        annotations.check_annotation_options(annotation_format, compression)
+        if annotation_format == 'zarr':
+            import zarr
+    except ImportError as e:
+        pytest.skip(str(e))
+    rng = np.random.default_rng(0)
+    labels = make_labels(IMAGE_SHAPE, make_rois(IMAGE_SHAPE, N_ROIS * 20, rng=rng), rng)
+    file_path = tmp_path.joinpath('labels' + annotations.annotation_extension(annotation_format))
+
+    write = lambda: annotations.write_annotations(file_path, labels, compression, 1, tile)
+    benchmark.pedantic(write, rounds=5)
+    read = lambda: np.asarray(annotations.read_annotations(file_path)[...])
+    benchmark.extra_info['read_ms'] = round(min(_timeit(read) for _ in range(5)) * 1000, 3)
+    benchmark.extra_info['size_mb'] = round(file_stat(file_path)[0] / 2**20, 3)
+    benchmark.extra_info['ratio'] = round(labels.nbytes / file_stat(file_path)[0], 1)
+    np.testing.assert_array_equal(read(), labels)
+
+def _timeit(func):
+
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def bench_build_pyramid(image_project, tmp_path, measure):
+    pytest.importorskip('zarr')
+    from napari_annotation_project.pyramid import build_pyramid
+
+    data = export.open_array(image_project.file_paths[0])
+    measure(build_pyramid, data, tmp_path.joinpath('pyramid.zarr'), min_size=64)
@@ -0,0 +1,52 @@
+"""
+Benchmarks of the project widget, run headless in an offscreen viewer.
+"""
+import itertools
+import pytest
+
+from napari_annotation_project import project as pr
+from conftest import record_peak_memory
+
+
+@pytest.fixture(scope='module')
+def widget():
+    import napari
+    from napari_annotation_project.project_widget import ProjectWidget
+
+    viewer = napari.Viewer(show=False)
+    widget = ProjectWidget(viewer)
+    yield widget
+    widget._close_project()
+    viewer.close()
+
+def bench_file_switch(widget, image_project, benchmark):
+    widget._on_click_load_project(project_path=image_project.project_path)
+    rows = itertools.cycle(range(widget.file_list.count()))
+
+    def switch():
+        widget.file_list.setCurrentRow(next(rows))
+
+    # empty the image cache so that each switch reads the file
+    benchmark.pedantic(switch, setup=widget.image_cache.clear, rounds=20)
+    widget.image_cache.clear()
+    record_peak_memory(benchmark, switch)
+
+def bench_add_files(widget, tmp_path, benchmark):
+    files = [f'/data/images/image_{i}.tif' for i in range(10000)]
+
+    def setup():
+        widget._close_project()
+        widget.params = pr.create_project(tmp_path.joinpath('project'))
+
+    def add_files():
+        widget.file_list.add_files(files)
+        widget._flush_params()
+
+    benchmark.pedantic(add_files, setup=setup, rounds=3)
+    setup()
+    record_peak_memory(benchmark, add_files)
+
+def bench_load_project_widget(widget, param_project, benchmark):
+    load = lambda: widget._on_click_load_project(project_path=param_project.project_path)
+    benchmark.pedantic(load, rounds=3)
+    record_peak_memory(benchmark, load)
@@ -0,0 +1,73 @@
+"""
+Shared fixtures of the benchmark suite. Project sizes are set with
+environment variables:
+
+BENCH_FILES : number of files of projects with images (default 20)
+BENCH_SHAPE : comma separated image shape (default 512,512)
+BENCH_STACK_SHAPE : comma separated shape of 3D stacks (default 32,512,512)
+BENCH_ROIS : number of rois per file (default 5)
+BENCH_PARAM_FILES : number of files of parameter-only projects (default 5000)
+"""
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, str(Path(__file__).parent))
+
+from synthetic import make_project
+
+
+N_FILES = int(os.environ.get('BENCH_FILES', 20))
+IMAGE_SHAPE = tuple(int(s) for s in os.environ.get('BENCH_SHAPE', '512,512').split(','))
+STACK_SHAPE = tuple(int(s) for s in os.environ.get('BENCH_STACK_SHAPE', '32,512,512').split(','))
+N_ROIS = int(os.environ.get('BENCH_ROIS', 5))
+N_PARAM_FILES = int(os.environ.get('BENCH_PARAM_FILES', 5000))
+
+
+def record_peak_memory(benchmark, func, *args, **kwargs):
+    """Run func once more under tracemalloc and store its peak Python
+    memory in the benchmark extra info. Kept separate from the timed runs
+    as tracing slows down execution."""
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info['peak_memory_mb'] = round(peak / 2**20, 3)
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmark a function and record its peak memory."""
+
+    def _measure(func, *args, **kwargs):
+        result = benchmark(func, *args, **kwargs)
+        record_peak_memory(benchmark, func, *args, **kwargs)
+        return result
+    return _measure
+
+@pytest.fixture(scope='session', params=['yaml', 'sqlite'])
+def param_project(request, tmp_path_factory):
+    """Large project without image files, for parameter benchmarks."""
+
+    path = tmp_path_factory.mktemp(f'params_{request.param}').joinpath('project')
+    return make_project(path, n_files=N_PARAM_FILES, rois_per_file=N_ROIS,
+                        backend=request.param, write_images=False)
+
+@pytest.fixture(scope='session')
+def image_project(tmp_path_factory):
+    """Project with images and annotations."""
+
+    path = tmp_path_factory.mktemp('images').joinpath('project')
+    return make_project(path, n_files=N_FILES, image_shape=IMAGE_SHAPE, rois_per_file=N_ROIS)
+
+@pytest.fixture(scope='session')
+def stack_project(tmp_path_factory):
+    """Project with a few 3D stacks, for export memory benchmarks."""
+
+    path = tmp_path_factory.mktemp('stacks').joinpath('project')
+    return make_project(path, n_files=2, image_shape=STACK_SHAPE, rois_per_file=N_ROIS)
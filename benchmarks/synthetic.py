@@ -0,0 +1,129 @@
+"""
+Generate synthetic projects of configurable size for benchmarks.
+"""
+from pathlib import Path
+import numpy as np
+import tifffile
+
+from napari_annotation_project import project as pr
+from napari_annotation_project import annotations
+
+
+def make_rois(image_shape, n_rois, roi_size=32, rng=None):
+    """
+    Create random square rois in the last two dimensions of an image.
+
+    Parameters
+    ----------
+    image_shape : tuple
+        shape of the image
+    n_rois : int
+        number of rois
+    roi_size : int
+        side of the rois, clipped to the image size
+    rng : numpy.random.Generator, optional
+        random generator
+
+    Returns
+    -------
+    rois : list of list
+        flat roi coordinates as stored in a project
+    """
+
+    if rng is None:
+        rng = np.random.default_rng(0)
+    size = min(roi_size, *image_shape[-2:])
+    rois = []
+    for _ in range(n_rois):
+        plane = [int(rng.integers(0, s)) for s in image_shape[:-2]]
+        y = int(rng.integers(0, image_shape[-2] - size + 1))
+        x = int(rng.integers(0, image_shape[-1] - size + 1))
+        corners = [[y, x], [y, x + size], [y + size, x + size], [y + size, x]]
+        rois.append([c for corner in corners for c in plane + corner])
+    return rois
+
+def make_labels(image_shape, rois, rng=None):
+    """
+    Create labels filling each roi with a random label between 1 and 3 on
+    an empty background, as sparse annotations are.
+
+    Parameters
+    ----------
+    image_shape : tuple
+        shape of the image
+    rois : list of list
+        flat roi coordinates, see make_rois
+    rng : numpy.random.Generator, optional
+        random generator
+
+    Returns
+    -------
+    labels : array
+        uint16 labels
+    """
+
+    if rng is None:
+        rng = np.random.default_rng(0)
+    labels = np.zeros(image_shape, dtype=np.uint16)
+    for roi in rois:
+        limits = np.array(roi).reshape(4, len(image_shape))
+        index = tuple(limits[0, :-2]) + (
+            slice(limits[0, -2], limits[2, -2]), slice(limits[0, -1], limits[1, -1]))
+        labels[index] = rng.integers(1, 4)
+    return labels
+
+def make_project(project_path, n_files=10, image_shape=(256, 256), rois_per_file=5,
+                 roi_size=32, backend='yaml', annotation_format='tif',
+                 write_images=True, seed=0):
+    """
+    Create a project with random images, annotations and rois.
+
+    Parameters
+    ----------
+    project_path : str or Path
+        path where the project is saved
+    n_files : int
+        number of files in the project
+    image_shape : tuple
+        shape of each image, the last two dimensions being y, x
+    rois_per_file : int
+        number of rois of each file
+    roi_size : int
+        side of the rois
+    backend : str
+        parameters backend, 'yaml' or 'sqlite'
+    annotation_format : str
+        annotation format, 'tif' or 'zarr'
+    write_images : bool
+        if False, only the parameters are created, which is enough to
+        benchmark parameter loading and saving with many files
+    seed : int
+        random seed
+
+    Returns
+    -------
+    project : Param
+        project object
+    """
+
+    rng = np.random.default_rng(seed)
+    project_path = Path(project_path)
+    image_folder = project_path.parent.joinpath(project_path.name + '_images')
+    image_folder.mkdir(parents=True, exist_ok=True)
+
+    file_paths = [image_folder.joinpath(f'image_{i}.tif').as_posix() for i in range(n_files)]
+    rois = {f: make_rois(image_shape, rois_per_file, roi_size, rng) for f in file_paths}
+    channels = {f: Path(f).stem for f in file_paths}
+    project = pr.create_project(
+        project_path, file_paths, channels, rois, backend=backend,
+        annotation_format=annotation_format)
+
+    if write_images:
+        extension = annotations.annotation_extension(annotation_format)
+        for f in file_paths:
+            tifffile.imwrite(f, rng.integers(0, 2**12, image_shape, dtype=np.uint16))
+            labels = make_labels(image_shape, rois[f], rng)
+            annotations.write_annotations(
+                pr.annotation_file_path(project_path, f, extension), labels, **project.annotation_options())
+
+    return project
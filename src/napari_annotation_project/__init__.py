@@ -4,5 +4,13 @@ try:
 except ImportError:
     __version__ = "unknown"
 
+__all__ = ['ProjectWidget']
 
-from .project_widget import ProjectWidget
\ No newline at end of file
+
+def __getattr__(name):
+    # the widget needs Qt and napari, only import it when it is requested so
+    # that the project functions can be used without them
+    if name == 'ProjectWidget':
+        from .project_widget import ProjectWidget
+        return ProjectWidget
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,8 +1,15 @@
+import os
 import shutil
 from pathlib import Path
 import numpy as np
 import skimage.io
+import pytest
 from napari_annotation_project import project as pr
+from napari_annotation_project import export
+from napari_annotation_project import annotations
+from napari_annotation_project.parameters import ParamSaver
+from napari_annotation_project.image_cache import ImageCache
+from napari_annotation_project.rois import rois_to_list, rois_to_array, layer_to_rois, overlap_report
 
 
 demoimage = np.random.randint(0,255, (30,30), dtype=np.uint8)
@@ -25,6 +32,32 @@ def test_create_project():
     assert project.project_path.joinpath('Parameters.yml').is_file(), 'Parameters file not created'
     assert project.project_path.joinpath('annotations').is_dir(), 'annotations folder not created'
 
+@pytest.mark.skipif(os.name == 'nt', reason='posix permissions')
+def test_parameters_file_mode(tmp_path):
+
+    umask = os.umask(0)
+    os.umask(umask)
+    project = pr.create_project(tmp_path.joinpath('project'))
+    parameters_path = project.project_path.joinpath('Parameters.yml')
+    assert parameters_path.stat().st_mode & 0o777 == 0o666 & ~umask, 'Wrong mode of new file'
+    os.chmod(parameters_path, 0o640)
+    project.save_parameters()
+    assert parameters_path.stat().st_mode & 0o777 == 0o640, 'Mode of saved file changed'
+
+@pytest.mark.skipif(os.name == 'nt', reason='posix permissions')
+def test_json_file_mode(tmp_path):
+
+    from napari_annotation_project.manifest import save_json
+
+    umask = os.umask(0)
+    os.umask(umask)
+    json_path = tmp_path.joinpath('export_manifest.json')
+    save_json(json_path, {'files': {}})
+    assert json_path.stat().st_mode & 0o777 == 0o666 & ~umask, 'Wrong mode of new file'
+    os.chmod(json_path, 0o640)
+    save_json(json_path, {'files': {}})
+    assert json_path.stat().st_mode & 0o777 == 0o640, 'Mode of saved file changed'
+
 def test_create_complete_project():
 
     remove_test_folder()
@@ -51,9 +84,473 @@ def test_load_project():
     rois = {f: [] for f in file_paths}
     channels = {f: None for f in file_paths}
 
-    assert project.rois == rois, 'rois not imported or saved correctly'
+    assert {f: rois_to_list(r) for f, r in project.rois.items()} == rois, 'rois not imported or saved correctly'
     assert project.channels == channels, 'channels not imported or saved correctly'
 
+def test_import_without_qt():
+
+    import subprocess
+    import sys
+
+    code = ("import sys, napari_annotation_project.project, napari_annotation_project.parameters; "
+            "print([m for m in ['qtpy', 'napari', 'skimage'] if m in sys.modules])")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]', f'Heavy modules imported: {out.stdout}'
+
+def test_rois_conversion():
+
+    flat = [[0, 0, 0, 15, 15, 15, 15, 0], [5, 5, 5, 10, 10, 10, 10, 5]]
+    rois = rois_to_array(flat)
+    assert rois.shape == (2, 4, 2), 'Wrong roi array shape'
+    assert rois_to_list(rois) == flat, 'Wrong roi conversion'
+    assert rois_to_array([], ndim=3).shape == (0, 4, 3), 'Wrong empty rois'
+    assert rois_to_list(rois_to_array([])) == [], 'Wrong empty rois'
+    np.testing.assert_array_equal(layer_to_rois(list(rois), 2), rois)
+    assert layer_to_rois([], 2).shape == (0, 4, 2), 'Wrong empty layer conversion'
+
+def test_roi_index():
+
+    project = pr.create_project(proj_path.joinpath('roi_index'), rois={
+        'image.tif': [[1, 0, 0, 1, 0, 10, 1, 10, 10, 1, 10, 0],
+                      [2, 0, 0, 2, 0, 10, 2, 10, 10, 2, 10, 0],
+                      [1, 5, 5, 1, 5, 15, 1, 15, 15, 1, 15, 5],
+                      [1, 20, 20, 1, 20, 30, 1, 30, 30, 1, 30, 20]]})
+    index = project.roi_index('image.tif')
+    assert project.roi_index('image.tif') is index, 'Index not cached'
+    np.testing.assert_array_equal(index.on_plane((1,)), [0, 2, 3])
+    np.testing.assert_array_equal(index.at_point([1, 7, 7]), [0, 2])
+    np.testing.assert_array_equal(index.in_bbox([12, 12], [22, 22], plane=(1,)), [2, 3])
+    assert index.overlaps() == [(0, 2, 25.0)], 'Wrong overlaps'
+
+    report = overlap_report(project)
+    assert len(report) == 1 and report[0]['overlap'] == 0.25, 'Wrong overlap report'
+
+    project.set_rois('image.tif', project.rois['image.tif'][:2])
+    assert len(project.roi_index('image.tif')) == 2, 'Index not updated'
+    shutil.rmtree(proj_path.joinpath('roi_index'))
+
+def test_ordered_writer(tmp_path):
+
+    import time
+    from napari_annotation_project.background_writer import OrderedWriter
+
+    def write(path, text, delay=0):
+        time.sleep(delay)
+        path.write_text(text)
+
+    writer = OrderedWriter()
+    path = tmp_path.joinpath('file.txt')
+    writer.submit(path, write, path, 'first', delay=0.1)
+    writer.submit(path, write, path, 'second')
+    writer.wait(path)
+    assert path.read_text() == 'second', 'Writes not ordered'
+
+    writer.submit(path, write, tmp_path.joinpath('missing', 'file.txt'), 'third')
+    with pytest.raises(FileNotFoundError):
+        writer.flush()
+    assert not writer.busy
+
+def test_sqlite_project():
+
+    sqlite_path = proj_path.joinpath('sqlite_project')
+    if sqlite_path.exists():
+        shutil.rmtree(sqlite_path)
+    file_paths = ['src/napari_annotation_project/_tests/test_data/demo_data.tif',
+                    'src/napari_annotation_project/_tests/test_data/demo_data2.tif']
+    project = pr.create_project(
+        project_path=sqlite_path, file_paths=file_paths,
+        rois={f: [] for f in file_paths}, channels={f: None for f in file_paths}, backend='sqlite')
+    assert sqlite_path.joinpath('Parameters.db').is_file(), 'Database not created'
+    assert not sqlite_path.joinpath('Parameters.yml').exists(), 'Parameters file created'
+
+    project.set_rois(file_paths[1], [[0, 0, 0, 15, 15, 15, 15, 0]])
+    project.set_channel(file_paths[1], 'demo_data2')
+    project.file_paths = file_paths[1:]
+    # rois of a file not in the file list, e.g. still being copied
+    project.set_rois('pending.tif', [[0, 0, 0, 5, 5, 5, 5, 0]])
+    project.save_parameters()
+
+    project = pr.load_project(sqlite_path)
+    assert project.backend == 'sqlite', 'Wrong backend'
+    assert project.file_paths == file_paths[1:], 'File list not updated'
+    assert {f: rois_to_list(r) for f, r in project.rois.items()} == {file_paths[1]: [[0, 0, 0, 15, 15, 15, 15, 0]]}, 'Rois not updated'
+    assert project.channels == {file_paths[1]: 'demo_data2'}, 'Channels not updated'
+
+    pr.convert_project(sqlite_path, 'yaml')
+    assert not sqlite_path.joinpath('Parameters.db').exists(), 'Database not removed'
+    project_yaml = pr.load_project(sqlite_path)
+    assert project_yaml.backend == 'yaml', 'Project not converted'
+    assert project_yaml.channels == project.channels, 'Wrong conversion'
+    assert project_yaml.rois.keys() == project.rois.keys(), 'Wrong conversion'
+    for f in project.rois:
+        np.testing.assert_array_equal(project_yaml.rois[f], project.rois[f], 'Wrong conversion')
+
+def test_delayed_save():
+
+    project = pr.load_project(proj_path)
+    saver = ParamSaver(project, delay=10)
+    for i in range(5):
+        project.rois[project.file_paths[0]] = [[0, 0, 0, i, i, i, i, 0]]
+        saver.request_save()
+    assert saver.pending, 'Save not delayed'
+    assert rois_to_list(pr.load_project(proj_path).rois[project.file_paths[0]]) == [[0, 0, 0, 4, 4, 4, 4, 0]], 'Pending save not flushed on load'
+    assert not saver.pending, 'Save still pending after flush'
+    assert [x.name for x in proj_path.iterdir() if x.suffix == '.tmp'] == [], 'Temporary file not removed'
+
+def test_export_project():
+
+    project = pr.load_project(proj_path)
+    project.rois[project.file_paths[0]] = [[0, 0, 0, 10, 10, 10, 10, 0]]
+    project.rois[project.file_paths[1]] = [[0, 0, 0, 15, 15, 15, 15, 0], [5, 5, 5, 10, 10, 10, 10, 5]]
+    skimage.io.imsave(pr.annotation_file_path(proj_path, project.file_paths[1]), image_annotation2, check_contrast=False)
+
+    # test data are overwritten when collecting other test modules, so read them back
+    image = skimage.io.imread(project.file_paths[0])
+    image2 = skimage.io.imread(project.file_paths[1])
+
+    export_folder = proj_path.joinpath('export')
+    name_dict = export.export_project(project, export_folder, n_workers=2)
+
+    assert len(name_dict) == 3, 'Wrong number of exported rois'
+    np.testing.assert_array_equal(
+        skimage.io.imread(export_folder.joinpath('source', 'img_0.tif')), image[0:10,0:10])
+    np.testing.assert_array_equal(
+        skimage.io.imread(export_folder.joinpath('source', 'img_2.tif')), image2[5:10,5:10])
+    np.testing.assert_array_equal(
+        skimage.io.imread(export_folder.joinpath('target', 'target_1.tif')), image_annotation2[0:15,0:15])
+    np.testing.assert_array_equal(
+        skimage.io.imread(export_folder.joinpath('target', 'target_0.tif')), np.zeros((10,10)))
+    assert skimage.io.imread(export_folder.joinpath('target', 'target_0.tif')).dtype == np.uint16, 'Export type of labels changed'
+
+    # all crops of an export have the same type
+    project.max_label = 255
+    export.export_project(project, export_folder, n_workers=2)
+    assert [skimage.io.imread(export_folder.joinpath('target', f'target_{i}.tif')).dtype
+            for i in range(3)] == [np.uint8] * 3, 'Labels not exported as uint8'
+    annotation_path = pr.annotation_file_path(proj_path, project.file_paths[0])
+    skimage.io.imsave(annotation_path, np.full((30, 30), 300, dtype=np.uint16), check_contrast=False)
+    export.export_project(project, export_folder, n_workers=2)
+    assert [skimage.io.imread(export_folder.joinpath('target', f'target_{i}.tif')).dtype
+            for i in range(3)] == [np.uint16] * 3, 'Types of labels mixed in an export'
+    Path(annotation_path).unlink()
+    project.max_label = 65535
+    assert export_folder.joinpath('rois_infos.csv').is_file(), 'Roi infos not exported'
+
+    # sharded export
+    shard_folder = proj_path.joinpath('export_npz')
+    name_dict = export.export_project(project, shard_folder, n_workers=2, export_format='npz', shard_size=2)
+    assert [x['shard'] for x in name_dict] == ['shard_00000.npz', 'shard_00000.npz', 'shard_00001.npz']
+    with np.load(shard_folder.joinpath('shard_00000.npz')) as shard:
+        np.testing.assert_array_equal(shard['img_0'], image[0:10,0:10])
+        np.testing.assert_array_equal(shard['target_1'], image_annotation2[0:15,0:15])
+    with np.load(shard_folder.joinpath(name_dict[2]['shard'])) as shard:
+        np.testing.assert_array_equal(shard[name_dict[2]['source_key']], image2[5:10,5:10])
+    assert not shard_folder.joinpath('source').exists(), 'Tif folders created for sharded export'
+    # a re-export with fewer shards leaves no stale shard
+    overlaps = [{'file_name': 'image.tif', 'roi_index': 0, 'other_index': 1, 'area': 1, 'iou': 0.5, 'overlap': 1}]
+    export.export_project(project, shard_folder, n_workers=2, export_format='npz', shard_size=3, overlaps=overlaps)
+    with open(shard_folder.joinpath('rois_overlaps.csv'), encoding='UTF8') as f:
+        assert f.read().splitlines()[1] == 'image.tif,0,1,1,0.5,1', 'Given overlap report not saved'
+    assert sorted(p.name for p in shard_folder.glob('*.npz')) == ['shard_00000.npz'], 'Stale shards kept'
+
+@pytest.fixture
+def multichannel_file(tmp_path, monkeypatch):
+    """Two channel image read by a plugin returning a channel_axis."""
+
+    import napari.plugins.io
+
+    image = np.random.randint(0, 255, (2, 30, 30), dtype=np.uint8)
+    file_path = tmp_path.joinpath('multichannel.tif')
+    skimage.io.imsave(file_path, image, check_contrast=False)
+
+    def read_data_with_plugins(paths, plugin=None, stack=False):
+        return [(skimage.io.imread(paths[0]), {'name': ['c0', 'c1'], 'channel_axis': 0}, 'image')], None
+    monkeypatch.setattr(napari.plugins.io, 'read_data_with_plugins', read_data_with_plugins)
+    return file_path, image
+
+def test_export_multichannel(multichannel_file, tmp_path):
+
+    file_path, image = multichannel_file
+    assert [meta['name'] for _, meta, _ in export.read_layers(file_path)] == ['c0', 'c1'], 'Channels not split'
+    np.testing.assert_array_equal(export.read_channel(file_path, 'c1'), image[1])
+
+    project = pr.create_project(tmp_path.joinpath('project'), file_paths=[file_path.as_posix()],
+                                channels={file_path.as_posix(): 'c1'},
+                                rois={file_path.as_posix(): [[0, 0, 0, 10, 10, 10, 10, 0]]})
+    export.export_project(project, tmp_path.joinpath('export'), n_workers=1)
+    np.testing.assert_array_equal(
+        skimage.io.imread(tmp_path.joinpath('export', 'source', 'img_0.tif')), image[1, 0:10, 0:10])
+
+def test_incremental_export():
+
+    project = pr.load_project(proj_path)
+    project.rois[project.file_paths[0]] = [[0, 0, 0, 10, 10, 10, 10, 0]]
+    project.rois[project.file_paths[1]] = [[0, 0, 0, 15, 15, 15, 15, 0], [5, 5, 5, 10, 10, 10, 10, 5]]
+    annotation_path = pr.annotation_file_path(proj_path, project.file_paths[1])
+    skimage.io.imsave(annotation_path, image_annotation2, check_contrast=False)
+
+    export_folder = proj_path.joinpath('export_incremental')
+    if export_folder.exists():
+        shutil.rmtree(export_folder)
+    export.export_project(project, export_folder, n_workers=1, incremental=True)
+    assert export_folder.joinpath('export_manifest.json').is_file(), 'Manifest not saved'
+    target_files = [export_folder.joinpath('target', f'target_{i}.tif') for i in range(3)]
+    mtimes = [f.stat().st_mtime_ns for f in target_files]
+
+    # nothing changed
+    export.export_project(project, export_folder, n_workers=1, incremental=True)
+    assert [f.stat().st_mtime_ns for f in target_files] == mtimes, 'Unchanged crops exported'
+
+    # annotations of the second file changed
+    skimage.io.imsave(annotation_path, image_annotation, check_contrast=False)
+    export.export_project(project, export_folder, n_workers=1, incremental=True)
+    assert target_files[0].stat().st_mtime_ns == mtimes[0], 'Unchanged crop exported'
+    np.testing.assert_array_equal(skimage.io.imread(target_files[1]), image_annotation[0:15,0:15])
+
+    # roi removed
+    project.rois[project.file_paths[1]] = [[0, 0, 0, 15, 15, 15, 15, 0]]
+    name_dict = export.export_project(project, export_folder, n_workers=1, incremental=True)
+    assert len(name_dict) == 2
+    assert not target_files[2].exists(), 'Orphan crop not removed'
+    assert not export_folder.joinpath('source', 'img_2.tif').exists(), 'Orphan crop not removed'
+
+def test_label_statistics():
+
+    from napari_annotation_project import statistics
+
+    project = pr.load_project(proj_path)
+    project.rois[project.file_paths[1]] = [[0, 0, 0, 15, 15, 15, 15, 0]]
+    annotation_path = pr.annotation_file_path(proj_path, project.file_paths[1])
+    skimage.io.imsave(annotation_path, image_annotation2, check_contrast=False)
+    if proj_path.joinpath(statistics.STATISTICS_NAME).exists():
+        proj_path.joinpath(statistics.STATISTICS_NAME).unlink()
+
+    stats = statistics.label_statistics(project, n_workers=2)
+    expected = np.bincount(image_annotation2.ravel())
+    assert stats[project.file_paths[1]]['counts'] == expected.tolist(), 'Wrong label counts'
+    assert stats[project.file_paths[1]]['coverage'] == 1.0, 'Wrong coverage'
+    np.testing.assert_allclose(
+        stats[project.file_paths[1]]['roi_fractions'][0],
+        np.bincount(image_annotation2[0:15,0:15].ravel()) / 225)
+    assert statistics.total_label_counts({'a': {'counts': [1, 2]}, 'b': {'counts': [3]}}).tolist() == [4, 2]
+    assert proj_path.joinpath(statistics.STATISTICS_NAME).is_file(), 'Statistics not cached'
+
+    # cached results are used for unchanged files only
+    cache = statistics.load_statistics_cache(proj_path.joinpath(statistics.STATISTICS_NAME))
+    cache[project.file_paths[1]]['statistics']['coverage'] = 0.5
+    statistics.save_json(proj_path.joinpath(statistics.STATISTICS_NAME), {'files': cache})
+    assert statistics.label_statistics(project)[project.file_paths[1]]['coverage'] == 0.5, 'Cache not used'
+    skimage.io.imsave(annotation_path, image_annotation, check_contrast=False)
+    assert statistics.label_statistics(project)[project.file_paths[1]]['coverage'] == 1.0, 'Changed file not scanned'
+
+def test_iter_roi_crops():
+
+    project = pr.load_project(proj_path)
+    project.rois[project.file_paths[0]] = [[0, 0, 0, 10, 10, 10, 10, 0]]
+    project.rois[project.file_paths[1]] = [[0, 0, 0, 15, 15, 15, 15, 0], [5, 5, 5, 10, 10, 10, 10, 5]]
+    skimage.io.imsave(pr.annotation_file_path(proj_path, project.file_paths[1]), image_annotation2, check_contrast=False)
+    image2 = skimage.io.imread(project.file_paths[1])
+
+    crops = list(pr.iter_roi_crops(project, n_workers=2, read_ahead=1))
+    assert [c[2]['image_index'] for c in crops] == [1, 2, 3], 'Wrong crop order'
+    image_crop, label_crop, metadata = crops[2]
+    assert metadata['file_name'] == project.file_paths[1]
+    assert metadata['roi_index'] == 1
+    np.testing.assert_array_equal(image_crop, image2[5:10,5:10])
+    np.testing.assert_array_equal(label_crop, image_annotation2[5:10,5:10])
+
+    batches = list(pr.iter_roi_crops(project, batch_size=2))
+    assert [len(b) for b in batches] == [2, 1], 'Wrong batches'
+
+def test_crop_roi_lazy(monkeypatch):
+
+    stack = np.random.randint(0, 255, (3, 4, 30, 30), dtype=np.uint16)
+    stack_path = proj_path.joinpath('stack.tif')
+    limits = np.array([[1, 2, 5, 5], [1, 2, 5, 15], [1, 2, 20, 15], [1, 2, 20, 5]])
+
+    skimage.io.imsave(stack_path, stack, check_contrast=False)
+    assert isinstance(export.open_array(stack_path), np.memmap), 'Uncompressed file not memory-mapped'
+    np.testing.assert_array_equal(export.crop_roi(export.open_array(stack_path), limits), stack[1, 2, 5:20, 5:15])
+
+    skimage.io.imsave(stack_path, stack, compress=1, check_contrast=False)
+    assert isinstance(export.open_array(stack_path), export.TiffPlanes), 'Compressed file not read by plane'
+    with export.open_array(stack_path) as data:
+        np.testing.assert_array_equal(export.crop_roi(data, limits), stack[1, 2, 5:20, 5:15])
+    assert data.tif.filehandle.closed, 'Tiff file not closed'
+
+    # files opened by crop_file are closed once the crops are done
+    import tifffile
+    opened = []
+    tiff_file = tifffile.TiffFile
+    def open_tiff(*args, **kwargs):
+        opened.append(tiff_file(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(tifffile, 'TiffFile', open_tiff)
+    job = {'file_path': stack_path, 'channel': None, 'annotation_path': proj_path.joinpath('missing_annot.tif'),
+           'rois': [limits.ravel().tolist()], 'label_dtype': 'uint8'}
+    export.crop_file(job)
+    assert len(opened) > 0 and all(tif.filehandle.closed for tif in opened), 'Tiff file left open'
+
+def test_zarr_annotations():
+
+    pytest.importorskip('zarr')
+    annotation_path = proj_path.joinpath('annotations', 'sparse_annot.zarr')
+    data = np.zeros((3, 600, 600), dtype=np.uint16)
+    data[1, 300:310, 300:310] = 2
+    annotations.write_annotations(annotation_path, data)
+
+    stored = annotations.read_annotations(annotation_path)
+    assert stored.nchunks_initialized == 1, 'Empty chunks written'
+    np.testing.assert_array_equal(stored[:], data)
+    assert annotations.has_annotations(annotation_path)
+    empty_path = proj_path.joinpath('annotations', 'empty_annot.zarr')
+    annotations.write_annotations(empty_path, np.zeros((100, 100), dtype=np.uint16))
+    assert empty_path.is_dir() and not annotations.has_annotations(empty_path), 'Empty store counted as annotations'
+    limits = np.array([[1, 290, 290], [1, 290, 320], [1, 320, 320], [1, 320, 290]])
+    np.testing.assert_array_equal(export.crop_roi(export.open_array(annotation_path), limits), data[1, 290:320, 290:320])
+
+def test_annotation_compression(tmp_path):
+
+    with pytest.raises(ValueError):
+        pr.create_project(tmp_path.joinpath('lz4'), annotation_compression='lz4')
+    project = pr.create_project(tmp_path.joinpath('project'), annotation_compression='none', annotation_tile=64)
+    project = pr.load_project(project.project_path)
+    assert project.annotation_options() == {'compression': 'none', 'compression_level': 1, 'tile': 64}
+
+    data = np.zeros((5, 100, 100), dtype=np.uint16)
+    data[2, 10:50, 20:60] = 3
+    annotation_path = tmp_path.joinpath('image_annot.tif')
+    annotations.write_annotations(annotation_path, data, compression='none')
+    assert isinstance(export.open_array(annotation_path), np.memmap), 'Uncompressed annotations not memory-mapped'
+    annotations.write_annotations(annotation_path, data, compression='deflate', compression_level=6, tile=64)
+    np.testing.assert_array_equal(annotations.read_annotations(annotation_path), data)
+
+def test_label_dtype():
+
+    assert annotations.label_dtype(255) == np.uint8
+    assert annotations.label_dtype(256) == np.uint16
+    assert annotations.label_dtype(70000) == np.uint32
+
+    data = np.zeros((10, 10), dtype=np.uint16)
+    data[0, 0] = 3
+    assert annotations.compact_labels(data, 255).dtype == np.uint8, 'Labels not compacted'
+    data[0, 0] = 300
+    assert annotations.compact_labels(data, 255).dtype == np.uint16, 'Labels truncated'
+
+    data = np.zeros((10, 10), dtype=np.uint8)
+    assert annotations.promote_labels(data, 255) is data, 'Labels promoted needlessly'
+    promoted = annotations.promote_labels(data, 300)
+    assert promoted.dtype == np.uint16, 'Labels not promoted'
+
+def test_pyramid(tmp_path):
+
+    pytest.importorskip('zarr')
+    import tifffile
+    from napari_annotation_project.pyramid import build_pyramid, PyramidCache, pyramid_path
+
+    image = np.random.randint(0, 1000, (2, 301, 200), dtype=np.uint16)
+    levels = build_pyramid(image, tmp_path.joinpath('pyramid.zarr'), min_size=80, chunk_size=32)
+    assert [level.shape for level in levels] == [(2, 301, 200), (2, 151, 100), (2, 76, 50)]
+    np.testing.assert_array_equal(levels[0][:], image)
+    assert levels[1][1, 0, 0] == np.round(image[1, :2, :2].mean()), 'Wrong downsampling'
+
+    image = np.random.randint(0, 1000, (2, 1100, 700), dtype=np.uint16)
+    image_path = tmp_path.joinpath('image.tif')
+    tifffile.imwrite(image_path, image[0], compression='zlib')
+    cache = PyramidCache(tmp_path.joinpath('project'), min_size=100)
+    assert cache.get(image_path) is None
+    cache.request(image_path).result()
+    assert len(cache.get(image_path)) == 3, 'Pyramid not cached'
+    old_path = pyramid_path(cache.project_path, image_path)
+
+    # modified files get a new pyramid and the previous one is removed
+    tifffile.imwrite(image_path, image[1])
+    assert cache.get(image_path) is None, 'Stale pyramid used'
+    cache.request(image_path).result()
+    np.testing.assert_array_equal(cache.get(image_path)[0][:], image[1])
+    assert not old_path.exists(), 'Stale pyramid not removed'
+
+    small_path = tmp_path.joinpath('small.tif')
+    tifffile.imwrite(small_path, image[0, :50, :50])
+    assert cache.request(small_path).result() is None, 'Pyramid of small image built'
+
+@pytest.mark.parametrize('tile', [None, (48, 48)])
+def test_pyramid_compressed_tiff(tmp_path, monkeypatch, tile):
+
+    pytest.importorskip('zarr')
+    import tifffile
+    from napari_annotation_project.pyramid import build_pyramid, PyramidCache, _iter_strips
+
+    image = np.random.randint(0, 1000, (1100, 700), dtype=np.uint16)
+    image_path = tmp_path.joinpath('image.tif')
+    tifffile.imwrite(image_path, image, compression='zlib', tile=tile, rowsperstrip=46)
+    expected = build_pyramid(image, tmp_path.joinpath('expected.zarr'))
+
+    # compressed single page images are decoded by strips or tiles
+    def fail(*args, **kwargs):
+        raise AssertionError('Image decoded entirely')
+    monkeypatch.setattr(tifffile.TiffPage, 'asarray', fail)
+    monkeypatch.setattr(tifffile.TiffPageSeries, 'asarray', fail)
+    with tifffile.TiffFile(image_path) as tif:
+        strips = list(_iter_strips(tif.pages[0], 64))
+    assert [start for _, start, _ in strips] == list(range(0, 1100, 64))
+    np.testing.assert_array_equal(np.concatenate([strip for _, _, strip in strips]), image)
+
+    cache = PyramidCache(tmp_path.joinpath('project'), min_size=100)
+    levels = cache.request(image_path).result()
+    assert len(levels) == len(expected), 'Wrong number of levels'
+    for level, expected_level in zip(levels, expected):
+        np.testing.assert_array_equal(level[:], expected_level[:])
+
+def test_copy_queue_cancel(monkeypatch):
+
+    import threading
+    from napari_annotation_project import copy_queue
+
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def copy_file(source, destination, cancel=None):
+        calls.append(source)
+        started.set()
+        release.wait(5)
+        return None if cancel.is_set() else Path(destination)
+    monkeypatch.setattr(copy_queue, 'copy_file', copy_file)
+
+    queue = copy_queue.CopyQueue()
+    copied = []
+    queue.copied.connect(lambda source, destination: copied.append(source))
+    queue.add('a.tif', 'images/a.tif')
+    queue.add('b.tif', 'images/b.tif')
+    assert started.wait(5)
+    queue.cancel()
+    release.set()
+    queue._thread.join(0.5)
+    assert calls == ['a.tif'] and copied == [], 'Cancelled copies not stopped'
+
+def test_image_cache():
+
+    file_paths = ['src/napari_annotation_project/_tests/test_data/demo_data.tif',
+                    'src/napari_annotation_project/_tests/test_data/demo_data2.tif']
+    cache = ImageCache(max_bytes=1000)
+    cache.prefetch(file_paths)
+    layer_data = cache.get(file_paths[0])
+    assert layer_data[0][1]['name'] == 'demo_data', 'Wrong layer name'
+    np.testing.assert_array_equal(layer_data[0][0], skimage.io.imread(file_paths[0]))
+    cache.get(file_paths[1])
+    assert cache.nbytes == 900, 'Least recently used image not discarded'
+    assert cache.get(file_paths[1]) is cache.get(file_paths[1]), 'Cached image read again'
+    cache.close()
+
+    # images larger than the budget are neither cached nor prefetched
+    cache = ImageCache(max_bytes=800)
+    cache.prefetch(file_paths)
+    assert len(cache._futures) == 0, 'Large image prefetched'
+    np.testing.assert_array_equal(cache.get(file_paths[0])[0][0], skimage.io.imread(file_paths[0]))
+    assert cache.nbytes == 0, 'Large image cached'
+    cache.close()
+
 def remove_test_folder():
 
     proj_path = Path('src/napari_annotation_project/_tests/test_project')
@@ -7,6 +7,7 @@ import skimage.io
 import shutil
 
 import napari_annotation_project.project as pr
+from napari_annotation_project.folder_list_widget import find_files
 
 demoimage = np.random.randint(0,255, (30,30), dtype=np.uint8)
 demoimage2 = np.random.randint(0,255, (30,30), dtype=np.uint8)
@@ -23,6 +24,9 @@ if proj_path.exists():
 projlocal_path = Path('src/napari_annotation_project/_tests/test_project_local').absolute()
 if projlocal_path.exists():
     shutil.rmtree(projlocal_path)
+projzarr_path = Path('src/napari_annotation_project/_tests/test_project_zarr').absolute()
+if projzarr_path.exists():
+    shutil.rmtree(projzarr_path)
 
 '''def test_fake():
     assert True
@@ -67,7 +71,7 @@ def test_project_widget_add_file(project_widget):
     project_widget.file_list.addItem(data_path.joinpath('demo_data2.tif').as_posix())
     assert project_widget.file_list.count() == 2, 'Second file not added'
 
-def test_project_widget_add_file_local(project_widget):
+def test_project_widget_add_file_local(project_widget, qtbot, tmp_path):
         
     project_widget.params = pr.create_project(projlocal_path)
     assert projlocal_path.joinpath('Parameters.yml').is_file(), 'Parameters file not created'
@@ -85,7 +89,44 @@ def test_project_widget_add_file_local(project_widget):
     project_widget.file_list.addItem(data_path.joinpath('demo_data2.tif').as_posix())
     assert project_widget.file_list.count() == 2, 'Second file not added'
 
+    # files are copied in the background and added to params once copied
+    qtbot.waitUntil(lambda: project_widget.params.file_paths == ['images/demo_data.tif', 'images/demo_data2.tif'])
     assert project_widget.params.project_path.joinpath('images','demo_data.tif').is_file(), 'Local file not added'
+    assert project_widget.params.local_project, 'Project not marked as local'
+
+    # files already present are not copied again
+    local_file = project_widget.params.project_path.joinpath('images','demo_data.tif')
+    inode = local_file.stat().st_ino
+    project_widget.file_list.addItem(data_path.joinpath('demo_data.tif').as_posix())
+    qtbot.waitUntil(lambda: project_widget.file_list.count() == 2)
+    assert local_file.stat().st_ino == inode, 'Identical file copied again'
+
+    # items whose text is not a normalized path are resolved as well
+    project_widget.file_list.addItem(data_path.as_posix() + '/./demo_data2.tif')
+    qtbot.waitUntil(lambda: project_widget.file_list.count() == 2)
+
+    # a different file with the same name is copied under a new name
+    other_file = tmp_path.joinpath('demo_data.tif')
+    skimage.io.imsave(other_file, np.zeros((10, 10), dtype=np.uint8), check_contrast=False)
+    project_widget.file_list.addItem(other_file.as_posix())
+    qtbot.waitUntil(lambda: project_widget.params.file_paths == [
+        'images/demo_data.tif', 'images/demo_data2.tif', 'images/demo_data_1.tif'])
+    assert local_file.stat().st_ino == inode, 'Existing file overwritten'
+    assert project_widget.file_list.count() == 3, 'Different file dropped'
+
+def test_project_add_folder(project_widget, qtbot):
+
+    folder_files = find_files(data_path, extensions=['.tif'])
+    assert folder_files == [data_path.joinpath('demo_data.tif').as_posix(),
+                            data_path.joinpath('demo_data2.tif').as_posix()], 'Wrong files found'
+
+    project_widget.params = pr.create_project(proj_path.joinpath('folder_project'))
+    project_widget.file_list.add_folder(data_path)
+    qtbot.waitUntil(lambda: project_widget.file_list.count() == 2)
+
+    assert project_widget.file_list.count() == 2, 'Folder files not added'
+    assert project_widget.params.file_paths == folder_files, 'Params not updated'
+    assert {f: len(r) for f, r in project_widget.params.rois.items()} == {f: 0 for f in folder_files}, 'Rois not initialized'
 
 def test_project_add_roi(project_widget):
     
@@ -144,6 +185,203 @@ def test_project_load(project_widget):
     np.testing.assert_array_equal(project_widget.viewer.layers['rois'].data[0], expected_roi, 'Wrong roi')
     np.testing.assert_array_equal(project_widget.viewer.layers['annotations'].data, image_annotation2, 'Wrong annotation')
 
+def test_project_load_no_write(project_widget):
+
+    pr.load_project(proj_path)
+    params_file = proj_path.joinpath('Parameters.yml')
+    mtime = params_file.stat().st_mtime_ns
+
+    project_widget._on_click_load_project(project_path=proj_path)
+    project_widget._flush_params()
+    assert project_widget.file_list.count() == 2, 'Files not loaded'
+    assert params_file.stat().st_mtime_ns == mtime, 'Parameters saved when loading'
+
+def test_project_reuse_layers(project_widget):
+
+    project_widget._on_click_load_project(project_path=proj_path)
+    project_widget.file_list.setCurrentRow(0)
+    layers = list(project_widget.viewer.layers)
+    project_widget._flush_params()
+    params_file = proj_path.joinpath('Parameters.yml')
+    mtime = params_file.stat().st_mtime_ns
+
+    project_widget.file_list.setCurrentRow(1)
+    assert list(project_widget.viewer.layers) == layers, 'Layers not reused'
+    assert project_widget.viewer.layers[0].name == 'demo_data2', 'Image layer not renamed'
+    np.testing.assert_array_equal(project_widget.viewer.layers[0].data, demoimage2, 'Wrong image')
+    np.testing.assert_array_equal(project_widget.viewer.layers['rois'].data[0], [[0, 0], [0, 15], [15, 15], [15,0]], 'Wrong roi')
+    project_widget._flush_params()
+    assert params_file.stat().st_mtime_ns == mtime, 'Parameters saved when switching files'
+
+    project_widget.check_reuse_layers.setChecked(False)
+    project_widget.file_list.setCurrentRow(0)
+    assert project_widget.viewer.layers[0] is not layers[0], 'Layers reused'
+    project_widget.check_reuse_layers.setChecked(True)
+
+def test_project_annotations_dirty(project_widget):
+
+    project_widget._on_click_load_project(project_path=proj_path)
+    project_widget.file_list.setCurrentRow(0)
+    assert not project_widget.annotations_dirty, 'Loaded annotations marked as modified'
+
+    annotation_file = proj_path.joinpath('annotations','demo_data_annot.tif')
+    mtime = annotation_file.stat().st_mtime_ns
+    project_widget.file_list.setCurrentRow(1)
+    assert annotation_file.stat().st_mtime_ns == mtime, 'Unmodified annotations saved'
+
+    project_widget.viewer.layers['annotations'].paint((0, 0), 3)
+    assert project_widget.annotations_dirty, 'Painting not tracked'
+    project_widget.file_list.setCurrentRow(0)
+    assert not project_widget.annotations_dirty, 'Annotations not saved when switching file'
+    project_widget.annotation_writer.flush()
+    assert skimage.io.imread(proj_path.joinpath('annotations','demo_data2_annot.tif'))[0, 0] == 3, 'Painted annotations not saved'
+
+    # undo modifies the data without emitting events
+    project_widget.file_list.setCurrentRow(1)
+    original = project_widget.viewer.layers['annotations'].data[2, 2]
+    project_widget.viewer.layers['annotations'].paint((2, 2), 5)
+    project_widget.save_annotations()
+    project_widget.viewer.layers['annotations'].undo()
+    assert project_widget.annotations_dirty, 'Undo not tracked'
+    project_widget.file_list.setCurrentRow(0)
+    project_widget.annotation_writer.flush()
+    assert skimage.io.imread(proj_path.joinpath('annotations','demo_data2_annot.tif'))[2, 2] == original, 'Undone annotations not saved'
+
+def test_project_background_save(project_widget):
+
+    project_widget._on_click_load_project(project_path=proj_path)
+    project_widget.file_list.setCurrentRow(0)
+    project_widget.viewer.layers['annotations'].paint((5, 5), 4)
+    # switching back reads the file only once the pending save is done
+    project_widget.file_list.setCurrentRow(1)
+    project_widget.file_list.setCurrentRow(0)
+    assert project_widget.viewer.layers['annotations'].data[5, 5] == 4, 'Stale annotations loaded'
+    assert not project_widget.annotation_writer.busy, 'Pending save not done'
+
+def test_project_label_dtype(project_widget):
+
+    project_widget._on_click_load_project(project_path=proj_path)
+    project_widget.file_list.setCurrentRow(0)
+    layer = project_widget.viewer.layers['annotations']
+    assert layer.data.dtype == np.uint16, 'Type of annotations of existing projects changed'
+
+    project_widget.params.max_label = 255
+    project_widget.file_list.setCurrentRow(1)
+    project_widget.file_list.setCurrentRow(0)
+    assert layer.data.dtype == np.uint8, 'Annotations not held as uint8'
+
+    # the annotations are promoted once a label that does not fit in their
+    # type is selected
+    layer.selected_label = 255
+    assert layer.data.dtype == np.uint8, 'Annotations promoted for a valid label'
+    layer.selected_label = 300
+    assert layer.selected_label == 300, 'Selected label clamped'
+    assert layer.data.dtype == np.uint16, 'Annotations not promoted'
+    layer.paint((1, 1), 300)
+    assert layer.data[1, 1] == 300, 'Label not painted'
+    project_widget.file_list.setCurrentRow(1)
+    project_widget.annotation_writer.flush()
+    assert skimage.io.imread(proj_path.joinpath('annotations','demo_data_annot.tif'))[1, 1] == 300, 'Promoted label not saved'
+    assert layer.selected_label == 300, 'Selected label not kept'
+    layer.selected_label = 1
+    project_widget.params.max_label = 65535
+
+def test_project_multichannel(project_widget, tmp_path, monkeypatch):
+
+    import napari.plugins.io
+
+    image = np.random.randint(0, 255, (2, 30, 30), dtype=np.uint8)
+    image_path = tmp_path.joinpath('multichannel.tif')
+    skimage.io.imsave(image_path, image, check_contrast=False)
+
+    def read_data_with_plugins(paths, plugin=None, stack=False):
+        return [(skimage.io.imread(paths[0]), {'name': ['c0', 'c1'], 'channel_axis': 0}, 'image')], None
+    monkeypatch.setattr(napari.plugins.io, 'read_data_with_plugins', read_data_with_plugins)
+
+    project_widget.params = pr.create_project(tmp_path.joinpath('project'))
+    project_widget.file_list.addItem(image_path.as_posix())
+    project_widget.file_list.setCurrentRow(0)
+    assert [x.name for x in project_widget.viewer.layers] == ['c0', 'c1', 'annotations', 'rois'], 'Channels not opened'
+    np.testing.assert_array_equal(project_widget.viewer.layers['c1'].data, image[1])
+    assert project_widget.viewer.layers['annotations'].data.shape == (30, 30)
+    project_widget.file_list.clear()
+
+def test_project_multiscale(project_widget, tmp_path):
+
+    pytest.importorskip('zarr')
+    from napari_annotation_project.pyramid import PyramidCache
+
+    image = np.random.randint(0, 255, (600, 500), dtype=np.uint8)
+    image_path = tmp_path.joinpath('large.tif')
+    skimage.io.imsave(image_path, image, check_contrast=False)
+    project_path = tmp_path.joinpath('project')
+    project = pr.create_project(project_path, file_paths=[image_path.as_posix(), data_path.joinpath('demo_data.tif').as_posix()])
+    project.multiscale = True
+    project.save_parameters()
+
+    project_widget._on_click_load_project(project_path=project_path)
+    assert project_widget.check_multiscale.isChecked(), 'Multiscale option not loaded'
+    project_widget.pyramid_cache = PyramidCache(project_path, min_size=256)
+    project_widget.file_list.setCurrentRow(0)
+    assert not project_widget.viewer.layers[0].multiscale, 'Pyramid used before being built'
+    project_widget.pyramid_cache.request(image_path).result()
+
+    project_widget.file_list.setCurrentRow(1)
+    project_widget.file_list.setCurrentRow(0)
+    layer = project_widget.viewer.layers[0]
+    assert layer.multiscale and len(layer.level_shapes) == 2, 'Pyramid not shown'
+    assert layer.name == 'large', 'Wrong layer name'
+    assert project_widget.viewer.layers['annotations'].data.shape == image.shape, 'Annotations not at full resolution'
+    project_widget.check_multiscale.setChecked(False)
+
+def test_project_lazy_images(project_widget):
+
+    project_widget._on_click_load_project(project_path=proj_path)
+    project_widget.check_lazy_images.setChecked(True)
+    project_widget.file_list.setCurrentRow(1)
+
+    assert isinstance(project_widget.viewer.layers[0].data, np.memmap), 'Image not memory-mapped'
+    np.testing.assert_array_equal(project_widget.viewer.layers[0].data, demoimage2, 'Wrong image')
+    assert pr.load_project(proj_path).lazy_images, 'Lazy option not saved'
+    project_widget.check_lazy_images.setChecked(False)
+
+def test_project_timing(project_widget, tmp_path):
+
+    from napari_annotation_project.timing import timers
+
+    project_widget._on_click_load_project(project_path=proj_path)
+    timers.clear()
+    timers.enable()
+    try:
+        project_widget.file_list.setCurrentRow(1)
+    finally:
+        timers.disable()
+
+    summary = timers.summary()
+    for stage in ['file_switch.total', 'file_switch.read_image', 'file_switch.read_annotations']:
+        assert summary[stage]['count'] == 1, f'Stage {stage} not recorded'
+    timers.to_csv(tmp_path.joinpath('timings.csv'))
+    timers.to_json(tmp_path.joinpath('timings.json'))
+    assert tmp_path.joinpath('timings.csv').is_file(), 'Timings not dumped'
+    timers.clear()
+
+def test_project_zarr_annotations(project_widget):
+
+    pytest.importorskip('zarr')
+    project_widget.params = pr.create_project(projzarr_path, annotation_format='zarr')
+    project_widget.file_list.addItem(data_path.joinpath('demo_data.tif').as_posix())
+    project_widget.file_list.addItem(data_path.joinpath('demo_data2.tif').as_posix())
+    project_widget.file_list.setCurrentRow(0)
+    project_widget.viewer.layers['annotations'].paint((0, 0), 3)
+    project_widget.file_list.setCurrentRow(1)
+
+    annotation_file = projzarr_path.joinpath('annotations','demo_data_annot.zarr')
+    assert annotation_file.is_dir(), 'Zarr annotations not created'
+    project_widget.file_list.setCurrentRow(0)
+    assert not projzarr_path.joinpath('annotations','demo_data2_annot.zarr').exists(), 'Annotations created for viewed file'
+    project_widget.file_list.setCurrentRow(0)
+    assert project_widget.viewer.layers['annotations'].data[0, 0] == 3, 'Zarr annotations not loaded'
+
 def test_project_remove_file(project_widget):
     
     project_widget._on_click_load_project(project_path=proj_path)
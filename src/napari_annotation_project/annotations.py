@@ -0,0 +1,277 @@
+from pathlib import Path
+import numpy as np
+
+# formats in which annotations can be stored. 'tif' stores a dense
+# compressed tiff file per image, 'zarr' a chunked zarr directory in which
+# only chunks containing annotations are written (requires zarr).
+ANNOTATION_FORMATS = ['tif', 'zarr']
+# compressions of annotation files. 'zstd' tiff files require imagecodecs,
+# and 'lz4' is only available for zarr files as tiff has no lz4 codec.
+ANNOTATION_COMPRESSIONS = ['none', 'deflate', 'zstd', 'lz4']
+
+
+def annotation_extension(annotation_format='tif'):
+    """Suffix of annotation files for a given format."""
+
+    if annotation_format not in ANNOTATION_FORMATS:
+        raise ValueError(f"Unknown annotation format {annotation_format}")
+    return f'_annot.{annotation_format}'
+
+def label_dtype(max_label=255):
+    """Smallest unsigned integer type holding labels up to max_label."""
+
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+def compact_labels(data, max_label=255):
+    """
+    Convert labels to the smallest unsigned integer type holding both
+    max_label and the highest label they contain.
+
+    Parameters
+    ----------
+    data : array
+        labels
+    max_label : int
+        highest label expected in the project
+
+    Returns
+    -------
+    data : array
+        labels, converted if needed
+    """
+
+    data = np.asarray(data)
+    top = int(data.max()) if data.size > 0 else 0
+    dtype = label_dtype(max(max_label, top))
+    if data.dtype == dtype:
+        return data
+    return data.astype(dtype)
+
+def promote_labels(data, label):
+    """
+    Convert labels to a larger type if label does not fit in their type.
+    Lazy arrays such as zarr arrays are then loaded in memory.
+
+    Parameters
+    ----------
+    data : array
+        labels
+    label : int
+        label about to be added
+
+    Returns
+    -------
+    data : array
+        labels, unchanged if label fits in their type
+    """
+
+    if data.dtype.kind in 'ui' and label <= np.iinfo(data.dtype).max:
+        return data
+    dtype = np.promote_types(data.dtype, label_dtype(label))
+    return np.asarray(data[...]).astype(dtype)
+
+def check_annotation_options(annotation_format='tif', compression='deflate'):
+    """
+    Check that annotations can be written with a given format and
+    compression.
+
+    Parameters
+    ----------
+    annotation_format : str
+        format of the annotation files, see ANNOTATION_FORMATS
+    compression : str
+        compression of the annotation files, see ANNOTATION_COMPRESSIONS
+
+    Raises
+    ------
+    ValueError
+        if the format or compression is unknown or they are incompatible
+    ImportError
+        if the compression requires a package that is not installed
+
+    """
+
+    annotation_extension(annotation_format)
+    if compression not in ANNOTATION_COMPRESSIONS:
+        raise ValueError(f"Unknown annotation compression {compression}")
+    if annotation_format == 'tif' and compression == 'lz4':
+        raise ValueError("lz4 compression is only available for zarr annotations")
+    if annotation_format == 'tif' and compression == 'zstd':
+        try:
+            import imagecodecs
+        except ImportError:
+            raise ImportError("zstd compression of tiff annotations requires imagecodecs") from None
+
+def create_annotations(file_path, shape, dtype=np.uint16):
+    """
+    Create an empty annotation array. Nothing is written to disk, also for
+    zarr files, until the annotations are saved with write_annotations, so
+    that files which are only viewed get no annotation file.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the annotation file
+    shape : tuple
+        shape of the annotations
+    dtype : numpy dtype
+        type of the annotations
+
+    Returns
+    -------
+    annotations : array
+        numpy array
+
+    """
+
+    return np.zeros(shape, dtype=dtype)
+
+def has_annotations(file_path):
+    """
+    Check if an annotation file exists and, for zarr files, contains at
+    least one chunk. Zarr files containing only metadata do not count as
+    annotations.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the annotation file
+
+    Returns
+    -------
+    annotated : bool
+        True if the file contains annotations
+    """
+
+    file_path = Path(file_path)
+    if file_path.suffix != '.zarr':
+        return file_path.exists()
+    if not file_path.is_dir():
+        return False
+    return any(p.is_file() and p.name not in _ZARR_METADATA for p in file_path.rglob('*'))
+
+def annotation_dtype(file_path):
+    """
+    Type of the annotations of a file, read from its metadata without
+    reading the annotations.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the annotation file
+
+    Returns
+    -------
+    dtype : numpy dtype or None
+        type of the annotations, None if the file contains no annotations
+    """
+
+    if not has_annotations(file_path):
+        return None
+    if Path(file_path).suffix == '.zarr':
+        return _open_zarr(file_path, mode='r').dtype
+    import tifffile
+    with tifffile.TiffFile(file_path) as tif:
+        return np.dtype(tif.series[0].dtype)
+
+def read_annotations(file_path):
+    """
+    Read an annotation file. Zarr files are opened lazily and can be
+    modified in place.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the annotation file
+
+    Returns
+    -------
+    annotations : array
+        numpy or zarr array
+
+    """
+
+    if Path(file_path).suffix == '.zarr':
+        return _open_zarr(file_path, mode='r+')
+    from skimage.io import imread
+    return imread(file_path)
+
+def write_annotations(file_path, data, compression='deflate', compression_level=1, tile=None):
+    """
+    Save annotations. In the zarr format, chunks that do not contain any
+    annotation are not written, and arrays already stored at file_path are
+    not written again.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the annotation file
+    data : array
+        annotations to save
+    compression : str
+        'none', 'deflate', 'zstd' or 'lz4' (zarr only). Zarr files are
+        compressed with blosc using the corresponding codec.
+    compression_level : int
+        compression level, higher levels give smaller files but are slower
+    tile : int, optional
+        size of the square tiles of tiff files, whose compression recent
+        versions of tifffile spread over several threads, or of the chunks
+        of zarr files (256 by default). If None, tiff files are written in
+        strips.
+
+    """
+
+    file_path = Path(file_path)
+    if file_path.suffix != '.zarr':
+        import tifffile
+        data = np.asarray(data)
+        kwargs = {}
+        if compression == 'deflate':
+            kwargs['compression'] = ('zlib', compression_level)
+        elif compression != 'none':
+            kwargs['compression'] = (compression, compression_level)
+        if tile is not None:
+            kwargs['tile'] = (min(tile, data.shape[-2]), min(tile, data.shape[-1]))
+            # tile sizes must be multiples of 16
+            kwargs['tile'] = tuple(max(16, t - t % 16) for t in kwargs['tile'])
+        tifffile.imwrite(file_path, data, **kwargs)
+        return
+
+    store = getattr(data, 'store', None)
+    store_path = getattr(store, 'root', None) or getattr(store, 'path', None)
+    if store_path is not None and Path(store_path).resolve() == file_path.resolve():
+        return
+    annotations = _open_zarr(file_path, mode='w', shape=data.shape, dtype=data.dtype, compression=compression,
+                             compression_level=compression_level, tile=tile)
+    annotations[...] = np.asarray(data)
+
+_ZARR_METADATA = ['zarr.json', '.zarray', '.zattrs', '.zgroup', '.zmetadata']
+
+def _open_zarr(file_path, mode, shape=None, dtype=None, compression='deflate', compression_level=1, tile=None):
+
+    import zarr
+
+    if mode == 'r+' or mode == 'r':
+        return zarr.open_array(Path(file_path).as_posix(), mode=mode)
+
+    # chunks are single planes of at most 256x256 pixels
+    tile = tile or 256
+    chunks = (1,) * (len(shape) - 2) + tuple(min(s, tile) for s in shape[-2:])
+    cname = {'deflate': 'zlib'}.get(compression, compression)
+    kwargs = {}
+    if int(zarr.__version__.split('.')[0]) < 3:
+        from numcodecs import Blosc
+        # zarr 3 skips empty chunks by default
+        kwargs['write_empty_chunks'] = False
+        kwargs['compressor'] = None if compression == 'none' else Blosc(cname=cname, clevel=compression_level)
+    else:
+        from zarr.codecs import BloscCodec, BytesCodec
+        kwargs['codecs'] = [BytesCodec()]
+        if compression != 'none':
+            kwargs['codecs'].append(BloscCodec(cname=cname, clevel=compression_level))
+    return zarr.open_array(
+        Path(file_path).as_posix(), mode=mode, shape=shape, chunks=chunks,
+        dtype=dtype, fill_value=0, **kwargs)
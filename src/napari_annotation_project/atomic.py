@@ -0,0 +1,59 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# permissions of new files are set explicitly as temporary files are
+# created owner-only. The umask can only be read by setting it, which is
+# done once here rather than from the threads saving files.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_write(path, mode='w', encoding=None, fsync=False):
+    """
+    Write a file through a temporary file in the same folder, which
+    replaces the file once completely written. The file keeps the
+    permissions of the file it replaces, or gets those of a file created
+    with open.
+
+    Parameters
+    ----------
+    path : str or Path
+        path of the file
+    mode : str
+        mode in which the temporary file is opened, 'w' or 'wb'
+    encoding : str, optional
+        encoding of text files
+    fsync : bool
+        if True, the temporary file is flushed to disk before replacing
+        the file
+
+    Yields
+    ------
+    file : file object
+        temporary file to write to
+    """
+
+    path = Path(path)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix='.' + path.stem, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.chmod(temp_path, _file_mode(path))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+def _file_mode(path):
+
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except OSError:
+        return 0o666 & ~_UMASK
@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+class OrderedWriter:
+    """
+    Write files on a background thread. Writes run one after the other in
+    the order they were submitted, so that the last write of a file is
+    always the one left on disk. Readers call wait with the file path
+    before reading it to never see a file that is about to be replaced.
+
+    Errors of a write are raised by the next wait or flush call concerning
+    that file.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self):
+        """True if writes are waiting or running."""
+
+        with self._lock:
+            return any(not f.done() for f in self._pending.values())
+
+    def submit(self, file_path, func, *args, **kwargs):
+        """Queue a write of a file.
+
+        Parameters
+        ----------
+        file_path : str or Path
+            path of the file written
+        func : callable
+            function writing the file, called with args and kwargs
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            future of the write
+        """
+
+        key = _key(file_path)
+        with self._lock:
+            future = self._executor.submit(func, *args, **kwargs)
+            self._pending[key] = future
+        future.add_done_callback(lambda f: self._on_done(key, f))
+        return future
+
+    def wait(self, file_path):
+        """Wait until the queued writes of a file are done."""
+
+        key = _key(file_path)
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None:
+            return
+        try:
+            future.result()
+        finally:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+
+    def flush(self):
+        """Wait until all queued writes are done."""
+
+        with self._lock:
+            keys = list(self._pending)
+        for key in keys:
+            self.wait(key)
+
+    def _on_done(self, key, future):
+
+        # failed writes are kept until waited for so that errors are raised
+        if future.exception() is None:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+
+def _key(file_path):
+
+    return Path(file_path).absolute().as_posix()
@@ -0,0 +1,190 @@
+import os
+import queue
+import shutil
+import threading
+from pathlib import Path
+from qtpy.QtCore import QObject, Signal
+
+from .manifest import file_hash
+
+
+class CopyQueue(QObject):
+    """
+    Copy files one after the other in a background thread. Files already
+    present at the destination with the same content are not copied again,
+    files with the same name but a different content are copied under a
+    new name.
+
+    Signals
+    -------
+    copied(source, destination)
+        emitted when a file was copied or was already present, destination
+        being the path of the copy
+    failed(source, message)
+        emitted when a file could not be copied
+    progress(done, total)
+        emitted after each file, total being the number of files queued
+        since the queue was last empty
+    """
+
+    copied = Signal(str, str)
+    failed = Signal(str, str)
+    progress = Signal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self._queue = queue.Queue()
+        # one cancel event per queued copy, so that a cancel is not lost
+        # when the next copy starts
+        self._cancel_events = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.done = 0
+        self.total = 0
+
+    @property
+    def busy(self):
+        """True if files are waiting to be copied."""
+
+        with self._lock:
+            return self.done < self.total
+
+    def add(self, source, destination):
+        """Queue a file copy.
+
+        Parameters
+        ----------
+        source : str
+            path of the file to copy, emitted unchanged by the copied and
+            failed signals
+        destination : str
+            path of the copy
+        """
+
+        cancel = threading.Event()
+        with self._lock:
+            self.total += 1
+            self._cancel_events.add(cancel)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((source, destination, cancel))
+        self.progress.emit(self.done, self.total)
+
+    def cancel(self):
+        """Drop queued copies and interrupt the current one."""
+
+        with self._lock:
+            for cancel in self._cancel_events:
+                cancel.set()
+            self._cancel_events.clear()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        with self._lock:
+            self.done = self.total = 0
+        self.progress.emit(0, 0)
+
+    def _run(self):
+
+        while True:
+            source, destination, cancel = self._queue.get()
+            if cancel.is_set():
+                continue
+            try:
+                copied_to = copy_file(source, destination, cancel)
+            except OSError as e:
+                self.failed.emit(source, str(e))
+                completed = True
+            else:
+                completed = copied_to is not None
+                if completed:
+                    self.copied.emit(source, copied_to.as_posix())
+            finally:
+                with self._lock:
+                    self._cancel_events.discard(cancel)
+            if completed:
+                with self._lock:
+                    self.done += 1
+                    done, total = self.done, self.total
+                    if done >= total:
+                        self.done = self.total = 0
+                self.progress.emit(done, total)
+
+def copy_file(source, destination, cancel=None, chunk_size=2**22):
+    """
+    Copy a file unless an identical file already exists at the destination.
+    If a different file exists at the destination, the file is copied
+    under a new name with a numbered suffix (e.g. image_1.tif), or to an
+    existing file of that name with the same content.
+    The copy is written to a temporary file renamed once complete.
+
+    Parameters
+    ----------
+    source : str or Path
+        path of the file to copy
+    destination : str or Path
+        path of the copy
+    cancel : threading.Event, optional
+        event interrupting the copy when set
+    chunk_size : int
+        number of bytes copied at once
+
+    Returns
+    -------
+    destination : Path or None
+        path of the copy, None if the copy was cancelled
+    """
+
+    source = Path(source)
+    destination = unique_destination(source, destination)
+    if destination.exists():
+        return destination
+
+    temp_path = destination.with_name('.' + destination.name + '.part')
+    try:
+        with open(source, 'rb') as fsrc, open(temp_path, 'wb') as fdst:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    break
+                chunk = fsrc.read(chunk_size)
+                if not chunk:
+                    break
+                fdst.write(chunk)
+        if cancel is not None and cancel.is_set():
+            temp_path.unlink()
+            return None
+        shutil.copystat(source, temp_path)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if temp_path.exists():
+            temp_path.unlink()
+        raise
+    return destination
+
+def unique_destination(source, destination):
+    """Find the destination of a copy: the first of destination,
+    destination_1, destination_2, ... which does not exist or is
+    identical to source."""
+
+    destination = Path(destination)
+    candidate = destination
+    index = 0
+    while candidate.exists() and not same_content(source, candidate):
+        index += 1
+        candidate = destination.with_name(f'{destination.stem}_{index}{destination.suffix}')
+    return candidate
+
+def same_content(file1, file2):
+    """Check if two files exist and have the same size and content hash."""
+
+    file1 = Path(file1)
+    file2 = Path(file2)
+    if not (file1.is_file() and file2.is_file()):
+        return False
+    if file1.stat().st_size != file2.stat().st_size:
+        return False
+    return file_hash(file1) == file_hash(file2)
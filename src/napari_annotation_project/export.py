@@ -0,0 +1,754 @@
+import csv
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import tifffile
+
+from .parameters import Param
+from . import project as pr
+from .annotations import annotation_extension, label_dtype, has_annotations, annotation_dtype
+from .timing import timers
+from .manifest import file_signature, load_manifest, save_manifest
+from .rois import overlap_report
+
+EXPORT_FORMATS = ['tif', 'npz']
+
+
+@timers.timed('export.total')
+def export_project(project, export_folder, source_folder_name='source',
+                   source_name='img_', target_folder_name='target',
+                   target_name='target_', n_workers=None, export_format='tif',
+                   shard_size=1000, incremental=False, overlaps=None):
+    """
+    Export cropped data of the images and the annotations using the rois.
+    Files are read directly from disk, without going through a viewer, and
+    are processed in parallel. Stages are recorded in timing.timers when
+    enabled, except those running in worker processes.
+
+    Crops are either saved as separate tif files or, with export_format
+    'npz', streamed into NPZ shards each containing shard_size pairs of
+    crops. In a shard, each crop is stored under its tif file name without
+    extension, e.g. img_0 and target_0.
+
+    With incremental export, the inputs of each crop (roi coordinates,
+    channel and hashes of the image and annotation files) are stored in a
+    manifest. Following exports only rewrite crops whose inputs changed
+    and remove crops that do not exist anymore. As crops are numbered
+    across files, adding or removing rois renumbers and rewrites the
+    crops of the following files.
+
+    Parameters
+    ----------
+    project : Param or str or Path
+        project object or path where the project is saved
+    export_folder : str or Path
+        folder where to export the data
+    source_folder_name : str
+        name of the folder containing the cropped images
+    source_name : str
+        prefix of the cropped images
+    target_folder_name : str
+        name of the folder containing the cropped annotations
+    target_name : str
+        prefix of the cropped annotations
+    n_workers : int, optional
+        number of processes to use. Defaults to the number of CPUs.
+    export_format : str
+        'tif' for one file per crop, 'npz' for sharded export
+    shard_size : int
+        number of crop pairs per shard for the 'npz' format
+    incremental : bool
+        if True, only export crops that changed since the last incremental
+        export. Only available for the 'tif' format.
+    overlaps : list of dict, optional
+        pairs of overlapping rois as returned by rois.overlap_report, saved
+        in rois_overlaps.csv. Computed if not given.
+
+    Returns
+    -------
+    name_dict : list of dict
+        information on each exported roi, as saved in rois_infos.csv.
+        Pairs of overlapping rois are listed in rois_overlaps.csv, see
+        rois.overlap_report.
+
+    """
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format}, should be one of {EXPORT_FORMATS}")
+    if incremental and export_format != 'tif':
+        raise ValueError("Incremental export is only available for the tif format")
+    if not isinstance(project, Param):
+        project = pr.load_project(project)
+
+    export_folder = Path(export_folder)
+    images_path = export_folder.joinpath(source_folder_name)
+    labels_path = export_folder.joinpath(target_folder_name)
+    if export_format == 'tif':
+        images_path.mkdir(parents=True, exist_ok=True)
+        labels_path.mkdir(parents=True, exist_ok=True)
+    else:
+        export_folder.mkdir(parents=True, exist_ok=True)
+
+    with timers.timer('export.jobs'):
+        jobs = export_jobs(project)
+    for job in jobs:
+        job.update({
+            'images_path': images_path,
+            'labels_path': labels_path,
+            'source_name': source_name,
+            'target_name': target_name,
+        })
+
+    if incremental:
+        settings = {'source_folder_name': source_folder_name, 'source_name': source_name,
+                    'target_folder_name': target_folder_name, 'target_name': target_name,
+                    'label_dtype': jobs[0]['label_dtype'] if len(jobs) > 0 else None}
+        with timers.timer('export.manifest'):
+            manifest = plan_incremental_export(jobs, export_folder, settings)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if export_format == 'tif':
+        to_export = [job for job in jobs if len(job.get('roi_indices', job['rois'])) > 0]
+        for _ in imap_jobs(export_file, to_export, n_workers):
+            pass
+        name_dict = [
+            {'file_name': job['file_name'], 'image_index': job['first_index'] + j + 1, 'roi_index': j}
+            for job in jobs for j in range(len(job['rois']))]
+        if incremental:
+            save_manifest(export_folder, manifest)
+        fieldnames = ['file_name', 'image_index', 'roi_index']
+    else:
+        # crops are written as they arrive so that only a few shards worth
+        # of data are held in memory
+        name_dict = []
+        with NpzShardWriter(export_folder, shard_size) as writer:
+            for job, crops in zip(jobs, imap_jobs(crop_file, jobs, n_workers)):
+                for j, (image_roi, annotations_roi) in enumerate(crops):
+                    index = job['first_index'] + j
+                    source_key = f"{source_name}{index}"
+                    target_key = f"{target_name}{index}"
+                    shard = writer.add({source_key: image_roi, target_key: annotations_roi})
+                    name_dict.append({
+                        'file_name': job['file_name'], 'image_index': index + 1, 'roi_index': j,
+                        'shard': shard, 'source_key': source_key, 'target_key': target_key})
+        fieldnames = ['file_name', 'image_index', 'roi_index', 'shard', 'source_key', 'target_key']
+
+    # export information for rois e.g. from which image they were extracted
+    with timers.timer('export.rois_infos'):
+        with open(export_folder.joinpath('rois_infos.csv'), 'w', encoding='UTF8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(name_dict)
+
+    # overlapping rois give overlapping crops, e.g. leaking between
+    # training and validation sets
+    with timers.timer('export.rois_overlaps'):
+        if overlaps is None:
+            overlaps = overlap_report(project)
+        with open(export_folder.joinpath('rois_overlaps.csv'), 'w', encoding='UTF8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['file_name', 'roi_index', 'other_index', 'area', 'iou', 'overlap'])
+            writer.writeheader()
+            writer.writerows(overlaps)
+
+    return name_dict
+
+def plan_incremental_export(jobs, export_folder, settings):
+    """
+    Select the crops to export by comparing their inputs with those of
+    the previous export, and remove the crops of the previous export that
+    do not exist anymore. The selected roi indices are set as roi_indices
+    in each job.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        export jobs as created by export_project
+    export_folder : Path
+        folder of the export
+    settings : dict
+        folder names and prefixes of the export, and the highest label
+
+    Returns
+    -------
+    manifest : dict
+        manifest to save once the export is done
+    """
+
+    previous = load_manifest(export_folder)
+    previous_files = previous.get('files', {})
+    previous_crops = previous.get('crops', {})
+    previous_settings = previous.get('settings') or settings
+    same_settings = previous_settings == settings
+
+    files = {}
+    def signature(path):
+        key = Path(path).as_posix()
+        if key not in files:
+            files[key] = file_signature(path, previous_files.get(key))
+        return files[key]
+
+    crops = {}
+    for job in jobs:
+        source = signature(job['file_path'])
+        annotation = signature(job['annotation_path']) if has_annotations(job['annotation_path']) else None
+        job['roi_indices'] = []
+        for j, roi in enumerate(job['rois']):
+            index = str(job['first_index'] + j)
+            crops[index] = {
+                'file_name': Path(job['file_name']).as_posix(),
+                'roi_index': j,
+                'roi': np.asarray(roi).ravel().tolist(),
+                'channel': job['channel'],
+                'source': source['sha256'] if source is not None else None,
+                'annotation': annotation['sha256'] if annotation is not None else None,
+            }
+            exists = (job['images_path'].joinpath(f"{job['source_name']}{index}.tif").exists()
+                      and job['labels_path'].joinpath(f"{job['target_name']}{index}.tif").exists())
+            if not (same_settings and exists and previous_crops.get(index) == crops[index]):
+                job['roi_indices'].append(j)
+
+    # remove crops of the previous export that are not overwritten
+    export_folder = Path(export_folder)
+    for index in previous_crops:
+        if same_settings and index in crops:
+            continue
+        for folder, name in [('source_folder_name', 'source_name'), ('target_folder_name', 'target_name')]:
+            old_file = export_folder.joinpath(previous_settings[folder], f"{previous_settings[name]}{index}.tif")
+            if old_file.exists():
+                old_file.unlink()
+
+    return {'settings': settings, 'files': files, 'crops': crops}
+
+def export_jobs(project):
+    """
+    Describe the crops of each file of a project. The crop numbering is
+    fixed beforehand so that files can be processed independently.
+
+    Parameters
+    ----------
+    project : Param
+        project parameters
+
+    Returns
+    -------
+    jobs : list of dict
+        one dict per file with rois, containing the file and annotation
+        paths, the channel, the rois, the index of the first crop and the
+        type of exported annotations. This type is the same for all files,
+        the smallest holding the max_label of the project and the labels of
+        every annotation file.
+    """
+
+    jobs = []
+    image_counter = 0
+    file_paths = project.file_paths if project.file_paths is not None else []
+    for f in file_paths:
+        rois = project.rois.get(f, [])
+        if len(rois) == 0:
+            continue
+        jobs.append({
+            'file_name': f,
+            'file_path': pr.resolve_file_path(project.project_path, f),
+            'annotation_path': pr.annotation_file_path(
+                project.project_path, f, annotation_extension(project.annotation_format)),
+            'channel': project.channels.get(f),
+            'rois': rois,
+            'first_index': image_counter,
+        })
+        image_counter += len(rois)
+
+    # annotations of all files are exported in the same type so that crops
+    # can be stacked, the type of each file is read from its metadata
+    max_label = project.max_label
+    for job in jobs:
+        dtype = annotation_dtype(job['annotation_path'])
+        if dtype is not None:
+            max_label = max(max_label, int(np.iinfo(dtype).max))
+    for job in jobs:
+        job['label_dtype'] = label_dtype(max_label).name
+    return jobs
+
+def imap_jobs(func, jobs, n_workers=1, read_ahead=None, threads=False):
+    """
+    Apply a function to jobs in worker processes or threads, yielding
+    results in order. At most read_ahead jobs are submitted ahead of the result
+    being consumed, which bounds the memory used by pending results.
+
+    Parameters
+    ----------
+    func : callable
+        picklable function applied to each job
+    jobs : list
+        arguments of func
+    n_workers : int
+        number of processes. With one worker, jobs are run in the calling
+        process.
+    read_ahead : int, optional
+        maximum number of pending jobs, defaults to twice n_workers
+    threads : bool
+        if True, use threads instead of processes. Processes are started
+        with spawn rather than fork, as forking a process running other
+        threads, such as the napari widget, can deadlock the children.
+
+    Yields
+    ------
+    result
+        result of func for each job
+    """
+
+    n_workers = min(n_workers, len(jobs))
+    if n_workers <= 1:
+        for job in jobs:
+            yield func(job)
+        return
+
+    if read_ahead is None:
+        read_ahead = 2 * n_workers
+    read_ahead = max(read_ahead, 1)
+    if threads:
+        executor = ThreadPoolExecutor(max_workers=n_workers)
+    else:
+        executor = ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context('spawn'))
+    with executor:
+        pending = deque()
+        for job in jobs:
+            if len(pending) >= read_ahead:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, job))
+        while pending:
+            yield pending.popleft().result()
+
+@timers.timed('export.crop_file')
+def crop_file(job):
+    """
+    Crop the rois of a single file. Data are opened lazily where possible
+    so that only the cropped regions are read and copied.
+
+    Parameters
+    ----------
+    job : dict
+        description of the crops of one file as created by export_jobs
+
+    Returns
+    -------
+    crops : list of tuple
+        (image_crop, annotations_crop) for each roi, or for the rois listed
+        in job['roi_indices'] if set. Annotation crops have the type
+        job['label_dtype'], and missing annotations are replaced by zeros.
+
+    """
+
+    image = open_channel(job['file_path'], job['channel'])
+    annotations = None
+    try:
+        if has_annotations(job['annotation_path']):
+            annotations = open_array(job['annotation_path'])
+
+        crops = []
+        for j in job.get('roi_indices', range(len(job['rois']))):
+            roi = job['rois'][j]
+            limits = np.array(roi).reshape(4, image.ndim).astype(int)
+            image_roi = crop_roi(image, limits)
+            if annotations is not None:
+                annotations_roi = crop_roi(annotations, limits).astype(job['label_dtype'], copy=False)
+            else:
+                annotations_roi = np.zeros(image_roi.shape, dtype=job['label_dtype'])
+            crops.append((image_roi, annotations_roi))
+    finally:
+        close_array(image)
+        close_array(annotations)
+    return crops
+
+def export_file(job):
+    """
+    Export the rois of a single file as tif files, or only the rois listed
+    in job['roi_indices'] if set.
+
+    Parameters
+    ----------
+    job : dict
+        description of the export of one file as created by export_project
+
+    Returns
+    -------
+    name_dict : list of dict
+        information on each exported roi
+
+    """
+
+    from skimage.io import imsave
+
+    name_dict = []
+    indices = job.get('roi_indices', range(len(job['rois'])))
+    for j, (image_roi, annotations_roi) in zip(indices, crop_file(job)):
+        image_counter = job['first_index'] + j
+        imsave(job['images_path'].joinpath(f"{job['source_name']}{image_counter}.tif"), image_roi, check_contrast=False)
+        imsave(job['labels_path'].joinpath(f"{job['target_name']}{image_counter}.tif"), annotations_roi, check_contrast=False)
+        name_dict.append({'file_name': job['file_name'], 'image_index': image_counter + 1, 'roi_index': j})
+
+    return name_dict
+
+class NpzShardWriter:
+    """
+    Write arrays into numbered NPZ files of a fixed number of entries.
+    Arrays are kept in memory until a shard is full and then written at
+    once, so memory use is bounded by the shard size. Shards of a
+    previous export, with the same prefix, are removed from the folder.
+
+    Parameters
+    ----------
+    folder : str or Path
+        folder where shards are saved
+    shard_size : int
+        number of entries per shard
+    prefix : str
+        prefix of the shard file names
+    """
+
+    def __init__(self, folder, shard_size=1000, prefix='shard_'):
+        if shard_size < 1:
+            raise ValueError("shard_size should be at least 1")
+        self.folder = Path(folder)
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.shard_index = 0
+        self._entries = []
+        for old_shard in self.folder.glob(f'{prefix}*.npz'):
+            old_shard.unlink()
+
+    def shard_name(self, index):
+        """File name of a shard."""
+
+        return f'{self.prefix}{index:05d}.npz'
+
+    def add(self, arrays):
+        """Add an entry to the current shard.
+
+        Parameters
+        ----------
+        arrays : dict
+            arrays of the entry, by key. Keys must be unique across the
+            shard.
+
+        Returns
+        -------
+        shard_name : str
+            name of the shard file the entry is written to
+        """
+
+        name = self.shard_name(self.shard_index)
+        self._entries.append(arrays)
+        if len(self._entries) >= self.shard_size:
+            self.flush()
+        return name
+
+    def flush(self):
+        """Write the current shard if it is not empty."""
+
+        if len(self._entries) == 0:
+            return
+        arrays = {k: v for entry in self._entries for k, v in entry.items()}
+        with timers.timer('export.write_shard'):
+            np.savez(self.folder.joinpath(self.shard_name(self.shard_index)), **arrays)
+        self._entries = []
+        self.shard_index += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+def crop_roi(data, limits):
+    """
+    Crop a 2D roi out of an nD array. The array is indexed at once with the
+    roi plane and rectangle, so only the cropped region is read and copied.
+
+    Parameters
+    ----------
+    data : array-like
+        array, memory-map, zarr array or TiffPlanes object to crop
+    limits : array
+        4 x ndim array of roi corners as stored in the rois layer
+
+    Returns
+    -------
+    cropped : array
+        copy of the roi region
+
+    """
+
+    index = tuple(limits[0,:-2]) + (
+        slice(limits[0,-2], limits[2,-2]),
+        slice(limits[0,-1], limits[1,-1])
+    )
+    return np.array(data[index])
+
+def open_array(file_path):
+    """
+    Open an image file without loading it in memory when possible.
+    Uncompressed tiff files are memory-mapped, compressed tiff stacks are
+    read plane by plane on access, zarr files are opened lazily and other
+    files are read entirely.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the image file
+
+    Returns
+    -------
+    data : array-like
+        memory-map, TiffPlanes object, zarr array or array. Close it with
+        close_array once done.
+
+    """
+
+    file_path = Path(file_path)
+    if file_path.suffix == '.zarr':
+        import zarr
+        return zarr.open_array(file_path.as_posix(), mode='r')
+    if file_path.suffix.lower() not in ['.tif', '.tiff']:
+        from skimage.io import imread
+        return imread(file_path)
+    try:
+        return tifffile.memmap(file_path, mode='r')
+    except ValueError:
+        pass
+    tif = tifffile.TiffFile(file_path)
+    series = tif.series[0]
+    page_ndim = len(series.pages[0].shape)
+    if ((len(series.shape) > page_ndim) and (series.pages[0].shape == series.shape[-page_ndim:])
+        and (len(series.pages) == int(np.prod(series.shape[:-page_ndim])))):
+        # pages might be read from multiple threads
+        tif.filehandle.lock = True
+        return TiffPlanes(series.pages, series.shape, page_ndim, series.dtype, tif=tif)
+    data = series.asarray()
+    tif.close()
+    return data
+
+def close_array(data):
+    """Close the file of an array opened with open_array, if it keeps one
+    open."""
+
+    if isinstance(data, TiffPlanes):
+        data.close()
+
+def open_channel(file_path, channel=None):
+    """Open the data of a file corresponding to a given layer name, lazily if
+    the layer corresponds to the whole file. See read_channel."""
+
+    if channel is None or channel == Path(file_path).stem:
+        return open_array(file_path)
+    return read_channel(file_path, channel)
+
+class TiffPlanes:
+    """
+    Minimal array-like view of a tiff series made of multiple pages. Integer
+    indexing along the leading dimensions selects pages, which are only read
+    from disk when reached. Indices beyond the pages are applied to the
+    page data. The tiff file stays open until close is called, or the
+    object is used as a context manager.
+
+    Parameters
+    ----------
+    pages : list of TiffPage
+        pages of the tiff series
+    shape : tuple
+        shape of the series
+    page_ndim : int
+        number of dimensions of a single page
+    dtype : numpy dtype
+        type of the data
+    offset : int
+        index of the first page of this view
+    tif : TiffFile, optional
+        file of the pages, closed by close
+    """
+
+    def __init__(self, pages, shape, page_ndim=2, dtype=None, offset=0, tif=None):
+        self.pages = pages
+        self.shape = tuple(shape)
+        self.page_ndim = page_ndim
+        self.dtype = dtype
+        self.offset = offset
+        self.tif = tif
+        self.ndim = len(self.shape)
+
+    def close(self):
+        """Close the tiff file. Views obtained by indexing share the file."""
+
+        if self.tif is not None:
+            self.tif.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def to_dask(self):
+        """Return a dask array reading each page on demand."""
+
+        import dask.array as da
+        from dask import delayed
+
+        page_shape = self.shape[-self.page_ndim:]
+        n_pages = int(np.prod(self.shape[:-self.page_ndim]))
+        planes = [
+            da.from_delayed(delayed(page.asarray)(), shape=page_shape, dtype=self.dtype)
+            for page in self.pages[self.offset:self.offset + n_pages]]
+        return da.stack(planes).reshape(self.shape)
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            data = self
+            for i, ind in enumerate(index):
+                if not isinstance(data, TiffPlanes):
+                    return data[index[i:]]
+                data = data[ind]
+            return data
+        if not isinstance(index, (int, np.integer)):
+            raise TypeError("TiffPlanes only supports integer indexing")
+        if index < 0:
+            index += self.shape[0]
+        if self.ndim == self.page_ndim + 1:
+            return self.pages[self.offset + index].asarray()
+        stride = int(np.prod(self.shape[1:-self.page_ndim]))
+        return TiffPlanes(self.pages, self.shape[1:], self.page_ndim, self.dtype, self.offset + index * stride, self.tif)
+
+def read_channel(file_path, channel=None):
+    """
+    Read the data of a file corresponding to a given layer name. Files are
+    first read as single images, as done by the default napari reader. If
+    the channel does not correspond to that image, the napari reader plugins
+    are used to split the file into layers.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the image file
+    channel : str, optional
+        name of the layer to read. If None, the whole image is returned.
+
+    Returns
+    -------
+    image : array
+        image data
+
+    """
+
+    file_path = Path(file_path)
+    if channel is None or channel == file_path.stem:
+        from skimage.io import imread
+        return imread(file_path)
+
+    for data, meta, _ in read_layers(file_path):
+        if meta['name'] == channel:
+            return np.asarray(data)
+
+    raise ValueError(f"Channel {channel} not found in {file_path}")
+
+def read_lazy_layers(file_path):
+    """
+    Open a file as a single layer without loading it in memory. Tiff files
+    are memory-mapped or, when compressed, opened as dask arrays reading
+    planes on demand, and zarr files are opened directly. Other formats are
+    read with the napari reader plugins.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the image file
+
+    Returns
+    -------
+    layer_data : list of tuple
+        (data, meta, layer_type) tuples, where meta contains the layer name
+
+    """
+
+    file_path = Path(file_path)
+    if file_path.suffix.lower() not in ['.tif', '.tiff', '.zarr']:
+        return read_layers(file_path)
+    data = open_array(file_path)
+    if isinstance(data, TiffPlanes):
+        data = data.to_dask()
+    return [(data, {'name': file_path.stem}, 'image')]
+
+def read_layers(file_path):
+    """
+    Read a file with the napari reader plugins, without a viewer. Layers
+    are named as napari would name them when opening the file, and images
+    with a channel axis are split into one layer per channel, see
+    split_layer_channels.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the image file
+
+    Returns
+    -------
+    layer_data : list of tuple
+        (data, meta, layer_type) tuples, where meta contains the layer name
+
+    """
+
+    from napari.plugins import _initialize_plugins
+    from napari.plugins.io import read_data_with_plugins
+
+    _initialize_plugins()
+    file_path = Path(file_path)
+    layer_data, _ = read_data_with_plugins([file_path.as_posix()])
+    layer_data = [(data[0], dict(data[1]) if len(data) > 1 else {}, data[2] if len(data) > 2 else 'image')
+                  for data in layer_data]
+    names = []
+    layers = []
+    for data, meta, layer_type in split_layer_channels(layer_data):
+        name = meta.get('name', file_path.stem)
+        # napari makes layer names unique by adding an index
+        unique_name = name
+        counter = 1
+        while unique_name in names:
+            unique_name = f'{name} [{counter}]'
+            counter += 1
+        names.append(unique_name)
+        meta['name'] = unique_name
+        layers.append((data, meta, layer_type))
+
+    return layers
+
+def split_layer_channels(layer_data):
+    """
+    Split images whose meta contains a channel_axis into one layer per
+    channel, as napari does when adding them to a viewer. Layers are then
+    valid arguments of Layer.create.
+
+    Parameters
+    ----------
+    layer_data : list of tuple
+        (data, meta, layer_type) tuples
+
+    Returns
+    -------
+    layer_data : list of tuple
+        (data, meta, layer_type) tuples without channel_axis
+    """
+
+    from napari.layers.utils.stack_utils import split_channels
+
+    layers = []
+    for data, meta, layer_type in layer_data:
+        if layer_type == 'image' and meta.get('channel_axis') is not None:
+            meta = dict(meta)
+            channel_axis = meta.pop('channel_axis')
+            layers.extend(split_channels(data, channel_axis, **meta))
+        else:
+            layers.append((data, meta, layer_type))
+    return layers
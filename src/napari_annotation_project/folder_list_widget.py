@@ -1,9 +1,12 @@
-import shutil
 import os
 from pathlib import Path
 from qtpy.QtWidgets import QListWidget
 from qtpy.QtCore import Qt
 
+# extensions of files added when dropping a folder
+IMAGE_EXTENSIONS = ['.tif', '.tiff', '.png', '.jpg', '.jpeg', '.bmp', '.gif',
+                    '.czi', '.nd2', '.lif', '.lsm', '.ome.tif', '.ome.tiff']
+
 
 class FolderList(QListWidget):
     # be able to pass the Napari viewer name (viewer)
@@ -17,6 +20,10 @@ class FolderList(QListWidget):
         self.local_copy = local_copy
         self.local_folder = local_folder
 
+        # only files with these extensions are added from dropped folders
+        self.extensions = IMAGE_EXTENSIONS
+        self._workers = []
+
         #self.model().rowsInserted.connect(self.addFileEvent())
 
     def dragEnterEvent(self, event):
@@ -36,22 +43,64 @@ class FolderList(QListWidget):
         if event.mimeData().hasUrls():
             event.setDropAction(Qt.CopyAction)
             event.accept()
-            
+
+            files = []
             for url in event.mimeData().urls():
                 file = str(url.toLocalFile())
                 if Path(file).is_dir():
-                    raise NotImplementedError("Folder drag and drop not implemented yet")
+                    self.add_folder(file)
                 else:
-                    if self.local_copy:
-                        copy_to = self.local_folder.joinpath(Path(file).name)
-                        shutil.copy(Path(file), copy_to)
-                        self.addItem(copy_to.as_posix())
-                    else:
-                        self.addItem(file)
-    
+                    files.append(file)
+            self.add_files(files)
+
+    def add_files(self, files):
+        """Add a list of files in a single batch."""
+
+        if len(files) == 0:
+            return
+        self.addItems(files)
+
+    def add_folder(self, folder):
+        """Scan a folder recursively in a separate thread and add all files
+        with a known extension once the scan is done."""
+
+        from napari.qt.threading import create_worker
+
+        worker = create_worker(find_files, folder, self.extensions, _start_thread=False)
+        worker.returned.connect(self.add_files)
+        worker.finished.connect(lambda: self._workers.remove(worker))
+        self._workers.append(worker)
+        worker.start()
+
     def addFileEvent(self):
         pass
 
     def select_first_file(self):
-        
-        self.setCurrentRow(0)
\ No newline at end of file
+
+        self.setCurrentRow(0)
+
+def find_files(folder, extensions=None):
+    """
+    Find files recursively in a folder.
+
+    Parameters
+    ----------
+    folder : str or Path
+        folder to scan
+    extensions : list of str, optional
+        only keep files with these extensions. If None, keep all files.
+
+    Returns
+    -------
+    files : list of str
+        sorted paths of the files found
+    """
+
+    if extensions is not None:
+        extensions = tuple(e.lower() for e in extensions)
+    files = []
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if extensions is None or name.lower().endswith(extensions):
+                files.append(Path(root).joinpath(name).as_posix())
+    return sorted(files)
@@ -0,0 +1,152 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .export import read_layers, read_lazy_layers
+
+
+class ImageCache:
+    """
+    Memory-budgeted LRU cache of decoded image files. Files can be
+    prefetched on a worker thread so that opening them later does not need
+    to read from disk.
+
+    Parameters
+    ----------
+    max_bytes: int
+        maximum memory used by cached images. The least recently used
+        images are discarded when exceeded, and images larger than
+        max_bytes are neither cached nor prefetched.
+    n_workers: int
+        number of threads used to prefetch files
+    lazy: bool
+        if True, files are opened lazily with read_lazy_layers. Lazy arrays
+        do not count towards the memory budget.
+    """
+
+    def __init__(self, max_bytes=2**30, n_workers=1, lazy=False):
+        self.max_bytes = max_bytes
+        self.lazy = lazy
+        self._cache = OrderedDict()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    @property
+    def nbytes(self):
+        """Memory currently used by cached images."""
+
+        with self._lock:
+            return sum(entry[2] for entry in self._cache.values())
+
+    def get(self, file_path):
+        """Get the layers of a file, reading it if it is not cached. If the
+        file is being prefetched, wait for it to be read.
+
+        Parameters
+        ----------
+        file_path : str or Path
+            path of the image file
+
+        Returns
+        -------
+        layer_data : list of tuple
+            (data, meta, layer_type) tuples as returned by read_layers
+        """
+
+        key, mtime = _cache_key(file_path)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._cache.move_to_end(key)
+                return entry[1]
+            future = self._futures.get(key)
+        if future is not None:
+            layer_data = future.result()
+            if layer_data is not None:
+                return layer_data
+        return self._load(file_path)
+
+    def prefetch(self, file_paths):
+        """Read files in the background if they are not already cached.
+        Files larger on disk than the memory budget are skipped, unless
+        they are opened lazily.
+
+        Parameters
+        ----------
+        file_paths : list of str or Path
+            paths of the image files
+        """
+
+        for file_path in file_paths:
+            if not self.lazy and _file_size(file_path) > self.max_bytes:
+                continue
+            key, mtime = _cache_key(file_path)
+            with self._lock:
+                entry = self._cache.get(key)
+                if (entry is not None and entry[0] == mtime) or key in self._futures:
+                    continue
+                self._futures[key] = self._executor.submit(self._prefetch_one, file_path)
+
+    def clear(self):
+        """Remove all images from the cache."""
+
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        """Stop prefetching and clear the cache."""
+
+        self._executor.shutdown(wait=False)
+        self.clear()
+
+    def _prefetch_one(self, file_path):
+
+        try:
+            return self._load(file_path)
+        except Exception:
+            # errors are raised again when the file is opened
+            return None
+        finally:
+            with self._lock:
+                self._futures.pop(_cache_key(file_path)[0], None)
+
+    def _load(self, file_path):
+
+        key, mtime = _cache_key(file_path)
+        if self.lazy:
+            layer_data = read_lazy_layers(file_path)
+        else:
+            layer_data = read_layers(file_path)
+        nbytes = sum(data.nbytes for data, _, _ in layer_data
+                     if isinstance(data, np.ndarray) and not isinstance(data, np.memmap))
+        if nbytes > self.max_bytes:
+            return layer_data
+        with self._lock:
+            self._cache[key] = (mtime, layer_data, nbytes)
+            self._cache.move_to_end(key)
+            total = sum(entry[2] for entry in self._cache.values())
+            while total > self.max_bytes:
+                _, (_, _, removed) = self._cache.popitem(last=False)
+                total -= removed
+        return layer_data
+
+def _file_size(file_path):
+
+    try:
+        return os.stat(file_path).st_size
+    except OSError:
+        return 0
+
+def _cache_key(file_path):
+
+    file_path = Path(file_path)
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except OSError:
+        mtime = None
+    return file_path.absolute().as_posix(), mtime
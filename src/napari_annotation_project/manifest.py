@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from .atomic import atomic_write
+
+MANIFEST_NAME = 'export_manifest.json'
+
+
+def file_hash(file_path, chunk_size=2**22):
+    """Compute the sha256 hash of a file, or of all files of a directory
+    such as a zarr array."""
+
+    file_path = Path(file_path)
+    digest = hashlib.sha256()
+    if file_path.is_dir():
+        paths = sorted(p for p in file_path.rglob('*') if p.is_file())
+    else:
+        paths = [file_path]
+    for path in paths:
+        if len(paths) > 1:
+            digest.update(path.relative_to(file_path).as_posix().encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def file_signature(file_path, previous=None):
+    """
+    Describe the content of a file by its size, modification time and hash.
+    The hash is only computed if the size or modification time differ from
+    a previous signature.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the file or directory
+    previous : dict, optional
+        previous signature of the same file
+
+    Returns
+    -------
+    signature : dict or None
+        dict with size, mtime_ns and sha256 keys, None if the file does
+        not exist
+    """
+
+    stat = file_stat(file_path)
+    if stat is None:
+        return None
+    size, mtime = stat
+    if previous is not None and previous['size'] == size and previous['mtime_ns'] == mtime:
+        return previous
+    return {'size': size, 'mtime_ns': mtime, 'sha256': file_hash(file_path)}
+
+def file_stat(file_path):
+    """
+    Get the size and modification time of a file. For directories such as
+    zarr arrays, the total size and latest modification time of the files
+    they contain are used.
+
+    Parameters
+    ----------
+    file_path : str or Path
+        path of the file or directory
+
+    Returns
+    -------
+    stat : tuple or None
+        (size, mtime_ns), None if the file does not exist
+    """
+
+    file_path = Path(file_path)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    if file_path.is_dir():
+        stats = [os.stat(p) for p in file_path.rglob('*') if p.is_file()]
+        size = sum(s.st_size for s in stats)
+        mtime = max([s.st_mtime_ns for s in stats], default=stat.st_mtime_ns)
+        return size, mtime
+    return stat.st_size, stat.st_mtime_ns
+
+def load_manifest(export_folder):
+    """
+    Load the manifest of a previous export.
+
+    Parameters
+    ----------
+    export_folder : str or Path
+        folder of the export
+
+    Returns
+    -------
+    manifest : dict
+        manifest with settings, files and crops keys. Empty if there is no
+        manifest or it cannot be read.
+    """
+
+    manifest_path = Path(export_folder).joinpath(MANIFEST_NAME)
+    try:
+        with open(manifest_path, encoding='UTF8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'settings': None, 'files': {}, 'crops': {}}
+    return manifest
+
+def save_manifest(export_folder, manifest):
+    """Write the manifest of an export, replacing the previous one once
+    completely written."""
+
+    save_json(Path(export_folder).joinpath(MANIFEST_NAME), manifest)
+
+def save_json(path, data):
+    """Write data to a json file through a temporary file, so that an
+    existing file is only replaced once the new one is complete."""
+
+    with atomic_write(path, encoding='UTF8') as f:
+        json.dump(data, f)
@@ -1,9 +1,22 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
+import atexit
+import copy
 import dataclasses
+import threading
 from pathlib import Path
+import numpy as np
 import yaml
 
+from .atomic import atomic_write
+from .sqlite_store import save_sqlite, DB_NAME
+from .timing import timers
+from .rois import rois_to_array, rois_to_list, RoiIndex
+
+# the libyaml bindings are much faster, use them when available
+YamlLoader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
 @dataclass
 class Param:
     """
@@ -18,9 +31,35 @@ class Param:
     channels: dict of str
         channel getting exported as source for each file
     rois: dict of arrays
-        flat list of rois for each file
+        N x 4 x ndim array of roi corners for each file. Rois given as
+        flat lists of coordinates are converted.
     local_project: bool
         if True, images are saved in local folder
+    backend: str
+        'yaml' to store parameters in Parameters.yml or 'sqlite' to store
+        them in the Parameters.db database
+    annotation_format: str
+        'tif' to store annotations as tiff files or 'zarr' to store them
+        as chunked zarr directories
+    lazy_images: bool
+        if True, images are opened lazily, only reading displayed planes
+    multiscale: bool
+        if True, multiscale pyramids of large images are built in the
+        background and cached in the pyramids folder of the project, and
+        images are shown at the resolution needed once their pyramid exists
+    annotation_compression: str
+        compression of annotation files, 'none', 'deflate', 'zstd' or
+        'lz4' (zarr only)
+    annotation_compression_level: int
+        compression level of annotation files
+    annotation_tile: int
+        size of the tiles of tiff annotations or of the chunks of zarr
+        annotations. If None, tiff annotations are written in strips.
+    max_label: int
+        highest label expected. Annotations use the smallest unsigned
+        integer type holding it, and are promoted to a larger type if a
+        higher label is painted. Defaults to 65535 (uint16), the type of
+        annotations of projects created without this option.
     
     """
     project_path: str = None
@@ -28,9 +67,76 @@ class Param:
     channels: dict = field(default_factory=dict)
     rois: dict = field(default_factory=dict)
     local_project: bool = False
+    backend: str = 'yaml'
+    annotation_format: str = 'tif'
+    lazy_images: bool = False
+    multiscale: bool = False
+    annotation_compression: str = 'deflate'
+    annotation_compression_level: int = 1
+    annotation_tile: int = None
+    max_label: int = 65535
+
+    def __post_init__(self):
+
+        self._changed_files = set()
+        self._stored_file_paths = None
+        self._lock = threading.Lock()
+        self.rois = {k: rois_to_array(v) for k, v in self.rois.items()}
+        self._roi_indices = {}
+
+    def set_rois(self, file, rois):
+        """Set the rois of a file, as an array or flat lists of coordinates,
+        and mark the file as changed."""
+
+        rois = rois_to_array(rois)
+        with self._lock:
+            self.rois[file] = rois
+            self._changed_files.add(file)
+
+    def roi_index(self, file):
+        """Spatial index of the rois of a file. The index is cached and
+        only rebuilt when the rois of the file are replaced."""
+
+        rois = self.rois.get(file, [])
+        index = self._roi_indices.get(file)
+        if index is None or index.rois is not rois:
+            index = RoiIndex(rois)
+            if isinstance(rois, np.ndarray):
+                self._roi_indices[file] = index
+        return index
+
+    def annotation_options(self):
+        """Options passed to write_annotations to
+        store annotations as configured in the project."""
+
+        return {
+            'compression': self.annotation_compression,
+            'compression_level': self.annotation_compression_level,
+            'tile': self.annotation_tile,
+        }
 
+    def set_channel(self, file, channel):
+        """Set the channel of a file and mark the file as changed."""
+
+        with self._lock:
+            self.channels[file] = channel
+            self._changed_files.add(file)
+
+    def pop_changed_files(self):
+        """Return the set of files changed since the last call."""
+
+        with self._lock:
+            changed = self._changed_files
+            self._changed_files = set()
+        return changed
+
+    @timers.timed('save.parameters')
     def save_parameters(self, alternate_path=None):
-        """Save parameters as yml file.
+        """Save parameters as yml file. The file is first written to a
+        temporary file which then replaces the existing one, so that the
+        parameters file is never left partially written. With the sqlite
+        backend, only the rows of files changed since the last save are
+        updated.
 
         Parameters
         ----------
@@ -38,17 +144,112 @@ class Param:
             place where to save the parameters file.
         """
 
+        if self.backend == 'sqlite':
+            if alternate_path is not None:
+                save_sqlite(self, Path(alternate_path).joinpath(DB_NAME), full=True)
+            else:
+                save_sqlite(self, Path(self.project_path).joinpath(DB_NAME))
+            return
+
         if alternate_path is not None:
             save_path = Path(alternate_path).joinpath("Parameters.yml")
         else:
             save_path = Path(self.project_path).joinpath("Parameters.yml")
-    
-        with open(save_path, "w") as file:
-            dict_to_save = dataclasses.asdict(self)
-            if dict_to_save['project_path'] is not None:
-                if not isinstance(dict_to_save['project_path'], str):
-                    dict_to_save['project_path'] = dict_to_save['project_path'].as_posix()
-            if dict_to_save['file_paths'] is not None:
-                if not isinstance(dict_to_save['file_paths'][0], str):
-                    dict_to_save['file_paths'] = [x.as_posix() for x in dict_to_save['file_paths']]
-            yaml.dump(dict_to_save, file)
+
+        # copy containers first as they might be modified while saving
+        # from a background thread
+        snapshot = copy.copy(self)
+        for f in dataclasses.fields(self):
+            value = getattr(self, f.name)
+            if isinstance(value, (dict, list)):
+                setattr(snapshot, f.name, type(value)(value))
+        # rois are saved as flat lists of coordinates
+        snapshot.rois = {k: rois_to_list(v) for k, v in snapshot.rois.items()}
+        dict_to_save = dataclasses.asdict(snapshot)
+        if dict_to_save['project_path'] is not None:
+            if not isinstance(dict_to_save['project_path'], str):
+                dict_to_save['project_path'] = dict_to_save['project_path'].as_posix()
+        if dict_to_save['file_paths']:
+            if not isinstance(dict_to_save['file_paths'][0], str):
+                dict_to_save['file_paths'] = [x.as_posix() for x in dict_to_save['file_paths']]
+
+        with atomic_write(save_path, fsync=True) as file:
+            yaml.dump(dict_to_save, file, Dumper=YamlDumper)
+
+
+# savers with a pending write, indexed by project path
+_pending_savers = {}
+_pending_lock = threading.Lock()
+
+class ParamSaver:
+    """
+    Write-behind saver for a Param object. Save requests are coalesced and
+    the parameters are only written once no new request arrived during
+    the debounce delay.
+
+    Parameters
+    ----------
+    param: Param
+        parameters to save
+    delay: float
+        debounce delay in seconds
+    """
+
+    def __init__(self, param, delay=0.5):
+        self.param = param
+        self.delay = delay
+        self.pending = False
+        self._timer = None
+        self._lock = threading.RLock()
+
+    def request_save(self):
+        """Schedule a save of the parameters, postponing any pending one."""
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self.pending = True
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+        with _pending_lock:
+            _pending_savers[_project_key(self.param.project_path)] = self
+
+    def flush(self):
+        """Write the parameters now if a save is pending."""
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self.pending:
+                self.pending = False
+                self.param.save_parameters()
+        with _pending_lock:
+            key = _project_key(self.param.project_path)
+            if _pending_savers.get(key) is self:
+                _pending_savers.pop(key)
+
+def flush_pending_saves(project_path=None):
+    """Write all pending parameter saves, or only those of a given project.
+
+    Parameters
+    ----------
+    project_path : str or Path, optional
+        path of the project to flush. If None, all projects are flushed.
+    """
+
+    with _pending_lock:
+        if project_path is None:
+            savers = list(_pending_savers.values())
+        else:
+            savers = [_pending_savers.get(_project_key(project_path))]
+    for saver in savers:
+        if saver is not None:
+            saver.flush()
+
+def _project_key(project_path):
+
+    return Path(project_path).absolute()
+
+atexit.register(flush_pending_saves)
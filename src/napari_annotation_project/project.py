@@ -1,8 +1,13 @@
 from pathlib import Path
-from .parameters import Param
+from .parameters import Param, flush_pending_saves, YamlLoader
+from .sqlite_store import load_sqlite, DB_NAME
+from .annotations import check_annotation_options
+from .rois import rois_to_array
 import yaml
 
-def create_project(project_path, file_paths=None, channels=None, rois=None):
+def create_project(project_path, file_paths=None, channels=None, rois=None, backend='yaml',
+                   annotation_format='tif', annotation_compression='deflate',
+                   annotation_compression_level=1, annotation_tile=None, max_label=65535):
     """
     Create a project.
 
@@ -15,7 +20,27 @@ def create_project(project_path, file_paths=None, channels=None, rois=None):
     channels : dict of str
         channel getting exported as source for each file
     rois : dict of arrays
-        flat list of rois for each file
+        rois of each file, as N x 4 x ndim arrays or flat lists of
+        coordinates
+    backend : str
+        'yaml' to store parameters in Parameters.yml or 'sqlite' to store
+        them in an indexed Parameters.db database, faster for large projects
+    annotation_format : str
+        'tif' to store annotations as tiff files or 'zarr' to store them as
+        chunked zarr directories, where only annotated chunks are saved
+    annotation_compression : str
+        'none', 'deflate', 'zstd' (requires imagecodecs for tiff files) or
+        'lz4' (zarr only). Uncompressed files are the fastest to save and
+        read but take the most space.
+    annotation_compression_level : int
+        compression level of annotation files
+    annotation_tile : int, optional
+        size of the tiles of tiff annotations, which can then be compressed
+        by several threads, or of the chunks of zarr annotations
+    max_label : int
+        highest label expected. The default stores annotations as uint16,
+        255 stores them as uint8. Annotations are promoted to a larger type
+        if a higher label is painted.
 
     Returns
     -------
@@ -24,6 +49,9 @@ def create_project(project_path, file_paths=None, channels=None, rois=None):
 
     """
 
+    if backend not in ['yaml', 'sqlite']:
+        raise ValueError(f"Unknown backend {backend}")
+    check_annotation_options(annotation_format, annotation_compression)
     project_path = Path(project_path)
     if not project_path.exists():
         project_path.mkdir()
@@ -36,17 +64,27 @@ def create_project(project_path, file_paths=None, channels=None, rois=None):
         project_path=project_path,
         file_paths=file_paths,
         channels=channels,
-        rois=rois)
+        rois=rois,
+        backend=backend,
+        annotation_format=annotation_format,
+        annotation_compression=annotation_compression,
+        annotation_compression_level=annotation_compression_level,
+        annotation_tile=annotation_tile,
+        max_label=max_label)
 
     if not project_path.joinpath('annotations').exists():
         project_path.joinpath('annotations').mkdir()
-    project.save_parameters()
+    if backend == 'sqlite':
+        project.save_parameters(alternate_path=project_path)
+    else:
+        project.save_parameters()
 
     return project
 
 def load_project(project_path):
     """
-    Load a project.
+    Load a project. Projects stored in a Parameters.db database are loaded
+    with the sqlite backend, otherwise Parameters.yml is used.
 
     Parameters
     ----------
@@ -62,13 +100,156 @@ def load_project(project_path):
 
     project = Param()
     project_path = Path(project_path)
-    if not project_path.joinpath('Parameters.yml').exists():
+    # make sure delayed saves of the same project are written before reading
+    flush_pending_saves(project_path)
+    if project_path.joinpath(DB_NAME).exists():
+        documents = load_sqlite(project_path.joinpath(DB_NAME))
+        documents['backend'] = 'sqlite'
+    elif project_path.joinpath('Parameters.yml').exists():
+        with open(project_path.joinpath('Parameters.yml')) as file:
+            documents = yaml.load(file, Loader=YamlLoader)
+    else:
         raise FileNotFoundError(f"Project {project_path} does not exist")
 
-    with open(project_path.joinpath('Parameters.yml')) as file:
-        documents = yaml.full_load(file)
     for k in documents.keys():
         setattr(project, k, documents[k])
     project.project_path = project_path
+    project.rois = {k: rois_to_array(v) for k, v in project.rois.items()}
+    if project.backend == 'sqlite':
+        project._stored_file_paths = list(project.file_paths or [])
 
-    return project
\ No newline at end of file
+    return project
+
+def convert_project(project_path, backend):
+    """
+    Convert the parameters storage of a project, e.g. to import a project
+    from or export it to the Parameters.yml format. The file of the previous
+    backend is removed.
+
+    Parameters
+    ----------
+    project_path : str
+        path where the project is saved
+    backend : str
+        'yaml' or 'sqlite'
+
+    Returns
+    -------
+    project : Project
+        project object
+
+    """
+
+    if backend not in ['yaml', 'sqlite']:
+        raise ValueError(f"Unknown backend {backend}")
+    project_path = Path(project_path)
+    project = load_project(project_path)
+    if project.backend == backend:
+        return project
+
+    project.backend = backend
+    project.save_parameters(alternate_path=project_path)
+    if backend == 'sqlite':
+        project_path.joinpath('Parameters.yml').unlink()
+    else:
+        project_path.joinpath(DB_NAME).unlink()
+    project._stored_file_paths = list(project.file_paths or [])
+
+    return project
+
+def annotation_file_path(project_path, filename, extension='_annot.tif'):
+    """
+    Create the path of the annotation file of a project file.
+
+    Parameters
+    ----------
+    project_path : str or Path
+        path where the project is saved
+    filename : str or Path
+        path of the project file
+    extension : str
+        suffix of the annotation file name
+
+    Returns
+    -------
+    complete_name : Path
+        path of the annotation file
+
+    """
+
+    return Path(project_path).joinpath('annotations', Path(filename).stem + extension)
+
+def resolve_file_path(project_path, file_path):
+    """
+    Find the location of a project file. Relative paths, as used for files
+    copied to the project, are resolved against the project folder.
+
+    Parameters
+    ----------
+    project_path : str or Path
+        path where the project is saved
+    file_path : str or Path
+        path of the file as stored in the project
+
+    Returns
+    -------
+    file_path : Path
+        path of the file
+
+    """
+
+    file_path = Path(file_path)
+    if not file_path.is_absolute():
+        in_project = Path(project_path).joinpath(file_path)
+        if in_project.exists():
+            return in_project
+    return file_path
+
+def iter_roi_crops(project_path, batch_size=None, n_workers=1, read_ahead=None):
+    """
+    Iterate over the cropped rois of the images and annotations of a
+    project, without writing them to disk. Files are read in order by a
+    pool of threads, at most read_ahead files ahead of the crop being
+    consumed.
+
+    Parameters
+    ----------
+    project_path : str or Path or Param
+        path where the project is saved, or project object
+    batch_size : int, optional
+        if given, yield lists of at most batch_size crops
+    n_workers : int
+        number of threads reading files
+    read_ahead : int, optional
+        maximum number of files read in advance, defaults to twice n_workers
+
+    Yields
+    ------
+    crop : tuple or list of tuple
+        (image_crop, label_crop, metadata) tuples, where metadata contains
+        the file_name, image_index and roi_index as in rois_infos.csv and
+        the roi coordinates. Missing annotations are replaced by zeros.
+
+    """
+
+    from . import export
+
+    project = project_path if isinstance(project_path, Param) else load_project(project_path)
+    jobs = export.export_jobs(project)
+
+    batch = []
+    for job, crops in zip(jobs, export.imap_jobs(
+            export.crop_file, jobs, n_workers, read_ahead, threads=True)):
+        for j, (image_crop, label_crop) in enumerate(crops):
+            metadata = {
+                'file_name': job['file_name'], 'image_index': job['first_index'] + j + 1,
+                'roi_index': j, 'roi': job['rois'][j]}
+            if batch_size is None:
+                yield image_crop, label_crop, metadata
+                continue
+            batch.append((image_crop, label_crop, metadata))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if len(batch) > 0:
+        yield batch
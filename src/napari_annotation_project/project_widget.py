@@ -1,18 +1,31 @@
-import csv
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 import numpy as np
-from skimage.io import imsave, imread
 import yaml
 
 from qtpy.QtWidgets import (QWidget, QHBoxLayout, QVBoxLayout,
 QGroupBox, QGridLayout, QListWidget, QPushButton, QFileDialog,
-QTabWidget, QLabel, QLineEdit, QScrollArea, QCheckBox, QSpinBox)
+QTabWidget, QLabel, QLineEdit, QScrollArea, QCheckBox, QSpinBox,
+QProgressBar, QComboBox)
 from qtpy.QtCore import Qt
+from napari.layers import Layer
 from .folder_list_widget import FolderList
-from .parameters import Param
+from .parameters import Param, ParamSaver
 from . import project as pr
+from . import export
+from . import annotations
+from .image_cache import ImageCache
+from .pyramid import PyramidCache
+from .copy_queue import CopyQueue
+from .background_writer import OrderedWriter
+from .timing import timers
+from .rois import layer_to_rois, overlap_report
+
+# item data marking files added to the list but still being copied to the project
+COPY_PENDING = 'copy_pending'
 
 
 class ProjectWidget(QWidget):
@@ -58,6 +71,17 @@ class ProjectWidget(QWidget):
         files_vgroup.glayout.addWidget(self.btn_remove_file, 1, 0, 1, 2)
         self.check_copy_files = QCheckBox('Copy files to project folder')
         files_vgroup.glayout.addWidget(self.check_copy_files, 2, 0, 1, 2)
+        self.check_lazy_images = QCheckBox('Open images lazily')
+        files_vgroup.glayout.addWidget(self.check_lazy_images, 3, 0, 1, 2)
+        self.check_reuse_layers = QCheckBox('Reuse layers when switching files')
+        self.check_reuse_layers.setChecked(True)
+        files_vgroup.glayout.addWidget(self.check_reuse_layers, 4, 0, 1, 2)
+        self.check_multiscale = QCheckBox('Multiscale cache of large images')
+        files_vgroup.glayout.addWidget(self.check_multiscale, 5, 0, 1, 2)
+        self.copy_progress = QProgressBar(visible=False)
+        files_vgroup.glayout.addWidget(self.copy_progress, 6, 0, 1, 1)
+        self.btn_cancel_copy = QPushButton('Cancel copy', visible=False)
+        files_vgroup.glayout.addWidget(self.btn_cancel_copy, 6, 1, 1, 1)
         
         # Keep track of the channel selection for annotations
         channel_group = VHGroup('Layer to annotate', orientation='V')
@@ -118,6 +142,16 @@ class ProjectWidget(QWidget):
         self._target_name.setText("target_")
         self.names_group.glayout.addWidget(self._target_name, 4, 1, Qt.AlignTop)
 
+        self.names_group.glayout.addWidget(QLabel('Export format'), 5, 0, Qt.AlignTop)
+        self.combo_export_format = QComboBox()
+        self.combo_export_format.addItems(export.EXPORT_FORMATS)
+        self.names_group.glayout.addWidget(self.combo_export_format, 5, 1, Qt.AlignTop)
+
+        self.check_incremental_export = QCheckBox('Only export changed rois (tif)')
+        self.check_incremental_export.setToolTip(
+            'Keep a manifest of exported crops and only rewrite those whose roi, channel, image or annotations changed')
+        self.names_group.glayout.addWidget(self.check_incremental_export, 6, 0, 1, 2)
+
         self.btn_export_data = QPushButton("Export annotations")
         self._export_layout.addWidget(self.btn_export_data)
 
@@ -126,6 +160,24 @@ class ProjectWidget(QWidget):
         self.export_folder = None
         self.ndim = None
         self.params = None
+        self._params_saver = None
+        # True when the annotations layer was edited since it was last saved or loaded
+        self.annotations_dirty = False
+        # True while rois are replaced when switching files
+        self._roi_update_suspended = False
+        # annotations of the file being left are saved in the background,
+        # and those of the file being opened are read while its image is read
+        self.annotation_writer = OrderedWriter()
+        self._io_executor = ThreadPoolExecutor(max_workers=1)
+        # images are read through a cache that prefetches neighbouring files
+        self.image_cache = ImageCache()
+        # pyramids of large images are built in the background, see _get_pyramid_cache
+        self.pyramid_cache = None
+        # files are copied to the project in the background
+        self.copy_queue = CopyQueue(self)
+        self.copy_queue.copied.connect(self._on_file_copied)
+        self.copy_queue.failed.connect(self._on_file_copy_failed)
+        self.copy_queue.progress.connect(self._on_copy_progress)
 
     def _add_connections(self):
         
@@ -133,6 +185,9 @@ class ProjectWidget(QWidget):
         self.file_list.currentItemChanged.connect(self._on_select_file)
         self.btn_remove_file.clicked.connect(self._on_remove_file)
         self.check_copy_files.stateChanged.connect(self._on_check_copy_files)
+        self.btn_cancel_copy.clicked.connect(self._on_cancel_copy)
+        self.check_lazy_images.stateChanged.connect(self._on_check_lazy_images)
+        self.check_multiscale.stateChanged.connect(self._on_check_multiscale)
         self.sel_channel.currentItemChanged.connect(self._update_channels_param)
         self.check_fixed_roi_size.stateChanged.connect(self._on_fixed_roi_size)
         self.btn_add_roi.clicked.connect(self._on_click_add_roi_fixed)
@@ -147,8 +202,11 @@ class ProjectWidget(QWidget):
         
         # clear existing layers. Suspend roi update while doing so, as 
         # roi layer suppresion would trigger a roi update and copy old rois to
-        # the new file
-        self.clear_layers()
+        # the new file. When reusing layers, they are kept and their data
+        # replaced once the new file is read.
+        if not self.check_reuse_layers.isChecked() or self.file_list.currentItem() is None:
+            with timers.timer('file_switch.clear_layers'):
+                self.clear_layers()
 
         # if file list is emtpy stop here
         if self.file_list.currentItem() is None:
@@ -156,16 +214,95 @@ class ProjectWidget(QWidget):
         
         # open image and make sure dimensions match previous images
         image_name = self.file_list.currentItem().text()
-        self.viewer.open(Path(image_name))
+        with timers.timer('file_switch.read_image', file_name=image_name):
+            # large images with a cached pyramid are shown as multiscale
+            # layers, without reading them entirely
+            levels = None
+            pyramid_cache = self._get_pyramid_cache()
+            if pyramid_cache is not None:
+                levels = pyramid_cache.get(image_name)
+                if levels is None:
+                    pyramid_cache.request(image_name)
+            if levels is not None:
+                layer_data = [(levels, {'name': Path(image_name).stem, 'multiscale': True}, 'image')]
+            else:
+                layer_data = self.image_cache.get(image_name)
+        with timers.timer('file_switch.add_image_layers'):
+            self._set_image_layers(layer_data)
         if self.ndim is not None:
-            newdim = self.viewer.layers[0].data.ndim
+            newdim = len(self.viewer.layers[0].data.shape)
             if newdim != self.ndim:
                 raise Exception(f"Image dimension changed. Only ndim={self.ndim} accepted.")
         else:
-            self.ndim = self.viewer.layers[0].data.ndim
+            self.ndim = len(self.viewer.layers[0].data.shape)
 
         return True
 
+    def _set_image_layers(self, layer_data):
+        """Show the layers of a file below the annotations and rois layers.
+        A single image layer is reused if the new file is read as a single
+        image of the same kind, otherwise image layers are replaced."""
+
+        # Layer.create does not accept a channel_axis
+        layer_data = export.split_layer_channels(layer_data)
+        old_layers = [x for x in self.viewer.layers if x.name not in ['annotations', 'rois']]
+        if len(old_layers) == 1 and len(layer_data) == 1:
+            layer = old_layers[0]
+            data, meta, layer_type = layer_data[0]
+            # multiscale layers are not reused, their meta contains multiscale
+            if (layer_type == 'image' and layer._type_string == 'image' and set(meta) <= {'name'}
+                and not layer.multiscale and data.ndim == layer.data.ndim
+                and (data.ndim > 2 and data.shape[-1] in (3, 4)) == layer.rgb):
+                shape_changed = data.shape != layer.data.shape
+                layer.data = data
+                layer.name = meta['name']
+                layer.reset_contrast_limits()
+                if shape_changed:
+                    self.viewer.reset_view()
+                return
+
+        for layer in old_layers:
+            self.viewer.layers.remove(layer)
+        for i, (data, meta, layer_type) in enumerate(layer_data):
+            self.viewer.layers.insert(i, Layer.create(data, meta, layer_type))
+        if len(old_layers) > 0:
+            self.viewer.reset_view()
+
+    @contextmanager
+    def _suspend_roi_update(self):
+        """Ignore changes of the rois layer, e.g. while replacing its data."""
+
+        self._roi_update_suspended = True
+        try:
+            yield
+        finally:
+            self._roi_update_suspended = False
+
+    def _prefetch_neighbours(self):
+        """Read the files before and after the current one in the background."""
+
+        row = self.file_list.currentRow()
+        neighbours = [self.file_list.item(i).text() for i in [row + 1, row - 1]
+                      if 0 <= i < self.file_list.count()]
+        # files with a pyramid are not read entirely when opened
+        pyramid_cache = self._get_pyramid_cache()
+        if pyramid_cache is not None:
+            neighbours = [f for f in neighbours if pyramid_cache.get(f) is None]
+        self.image_cache.prefetch(neighbours)
+
+    def _get_pyramid_cache(self):
+        """Pyramid cache of the current project, None if multiscale
+        images are disabled."""
+
+        if self.params is None or not self.params.multiscale:
+            return None
+        project_path = Path(self.params.project_path).absolute()
+        if self.pyramid_cache is None or self.pyramid_cache.project_path != project_path:
+            if self.pyramid_cache is not None:
+                self.pyramid_cache.close()
+            self.pyramid_cache = PyramidCache(project_path)
+        return self.pyramid_cache
+
     def clear_layers(self):
         """Remove all layers from viewer."""
         
@@ -178,7 +315,13 @@ class ProjectWidget(QWidget):
 
     def _close_project(self, clear_files=True):
         
+        if clear_files:
+            self._on_cancel_copy()
+        self._flush_params()
+        self.annotation_writer.flush()
+        self.image_cache.clear()
         self.viewer.layers.clear()
+        self.annotations_dirty = False
         self.sel_channel.clear()
         if clear_files:
             self.file_list.clear()
@@ -189,32 +332,116 @@ class ProjectWidget(QWidget):
         file_index = self._get_current_file()
         self.file_list.takeItem(self.file_list.currentRow())
         self._update_params_file_list()
-        self.params.channels.pop(file_index)
-        self.params.rois.pop(file_index)
-        self.params.save_parameters()
+        self.params.channels.pop(file_index, None)
+        self.params.rois.pop(file_index, None)
+        self._save_params()
         annotation_file = Path(self._create_annotation_filename_current(file_index))
-        if annotation_file.exists():
+        self.annotation_writer.wait(annotation_file)
+        if annotation_file.is_dir():
+            shutil.rmtree(annotation_file)
+        elif annotation_file.exists():
             annotation_file.unlink()
 
     def _on_add_file(self, parent, first, last):
-        """Update params when adding or removing a file"""
+        """Update params when adding files. Files inserted in a single batch
+        are handled at once and params are saved once. Files to copy to the
+        project are only added to the params once copied."""
         
         if self.params is None:
             self._on_click_select_project()
-        if self.check_copy_files.checkState() == 2:
-            file = Path(self.file_list.item(last).text())
-            if file.parts[0] != 'images':
-                copy_to = Path("images") / file.name
-                shutil.copy(file, copy_to)
-                self.file_list.item(last).setText(copy_to.as_posix())
 
+        new_files = []
+        for i in range(first, last + 1):
+            item = self.file_list.item(i)
+            file = Path(item.text())
+            if self.check_copy_files.checkState() == 2 and file.parts[0] != 'images':
+                item.setData(Qt.UserRole, COPY_PENDING)
+                copy_to = Path(self.params.project_path).joinpath('images', file.name)
+                # the item text identifies the item once copied
+                self.copy_queue.add(item.text(), copy_to.as_posix())
+            else:
+                new_files.append(item.text())
+
+        self._register_files(new_files)
+
+    def _register_files(self, files, channels=None, rois=None):
+        """Add files present in the file list to the params and save them.
+
+        Parameters
+        ----------
+        files: list of str
+            files to add
+        channels: dict, optional
+            channels of the files, if known
+        rois: dict, optional
+            rois of the files, if known
+        """
+
+        channels = channels if channels is not None else {}
+        rois = rois if rois is not None else {}
         self._update_params_file_list()
-        for f in self.params.file_paths:
+        for f in files:
             if f not in self.params.channels.keys():
-                self.params.channels[f] = None
+                self.params.set_channel(f, channels.get(f))
             if f not in self.params.rois.keys():
-                self.params.rois[f] = []
-        self.params.save_parameters()
+                self.params.set_rois(f, rois.get(f, []))
+        self._save_params()
+
+    def _find_pending_item(self, file):
+        """Find the list item of a file being copied."""
+
+        for item in self.file_list.findItems(file, Qt.MatchExactly):
+            if item.data(Qt.UserRole) == COPY_PENDING:
+                return item
+        return None
+
+    def _on_file_copied(self, source, destination):
+        """Replace a copied file by its copy in the file list and params"""
+
+        item = self._find_pending_item(source)
+        if item is None or self.params is None:
+            return
+
+        self.params.local_project = True
+        new_name = (Path("images") / Path(destination).name).as_posix()
+        # keep channel and rois set while the file was being copied
+        channels = {new_name: self.params.channels.pop(source, None)}
+        rois = {new_name: self.params.rois.pop(source, [])}
+        if self.params.file_paths is not None and new_name in self.params.file_paths:
+            # the file is already part of the project
+            self.file_list.takeItem(self.file_list.row(item))
+            self._register_files([])
+            return
+        item.setData(Qt.UserRole, None)
+        item.setText(new_name)
+        self._register_files([new_name], channels=channels, rois=rois)
+
+    def _on_file_copy_failed(self, source, message):
+        """Remove files that could not be copied from the list"""
+
+        item = self._find_pending_item(source)
+        if item is not None:
+            self.file_list.takeItem(self.file_list.row(item))
+        from napari.utils.notifications import show_warning
+        show_warning(f"Could not copy {source}: {message}")
+
+    def _on_copy_progress(self, done, total):
+        """Show progress of background copies"""
+
+        copying = done < total
+        self.copy_progress.setVisible(copying)
+        self.btn_cancel_copy.setVisible(copying)
+        if copying:
+            self.copy_progress.setMaximum(total)
+            self.copy_progress.setValue(done)
+
+    def _on_cancel_copy(self):
+        """Cancel background copies and remove files not yet copied"""
+
+        self.copy_queue.cancel()
+        for i in reversed(range(self.file_list.count())):
+            if self.file_list.item(i).data(Qt.UserRole) == COPY_PENDING:
+                self.file_list.takeItem(i)
 
     def _on_check_copy_files(self):
         """Update file list adding mode when checkbox is toggled"""
@@ -227,37 +454,81 @@ class ProjectWidget(QWidget):
             self.file_list.local_folder = Path("images/")
             if not self.file_list.local_folder.exists():
                 self.file_list.local_folder.mkdir(parents=True)
-            self.params.local_project = True
         else:
             self.file_list.local_copy = False
             self.file_list.local_folder = None
             self.params.local_project = False
 
+    def _on_check_lazy_images(self):
+        """Switch between eager and lazy image opening"""
+
+        lazy = self.check_lazy_images.isChecked()
+        self.image_cache.lazy = lazy
+        self.image_cache.clear()
+        if self.params is not None and self.params.lazy_images != lazy:
+            self.params.lazy_images = lazy
+            self._save_params()
+
+    def _on_check_multiscale(self):
+        """Switch the multiscale cache of large images on or off. The
+        cache requires zarr."""
+
+        multiscale = self.check_multiscale.isChecked()
+        if multiscale:
+            try:
+                import zarr
+            except ImportError:
+                from napari.utils.notifications import show_warning
+                show_warning("The multiscale cache requires zarr")
+                self.check_multiscale.setChecked(False)
+                return
+        if self.params is not None and self.params.multiscale != multiscale:
+            self.params.multiscale = multiscale
+            self._save_params()
+
     def _update_params_file_list(self):
         """Update params file list when adding or removing a file"""
 
-        self.params.file_paths = []
-        if self.file_list.count() == 0:
+        # remove duplicates while keeping the list order, and ignore files
+        # that are still being copied
+        file_paths = [self.file_list.item(i).text() for i in range(self.file_list.count())
+                      if self.file_list.item(i).data(Qt.UserRole) != COPY_PENDING]
+        if len(file_paths) == 0:
             self.params.file_paths = None
         else:
-            for i in range(self.file_list.count()):
-                if self.file_list.item(i).text() not in self.params.file_paths:
-                    self.params.file_paths.append(self.file_list.item(i).text())
+            self.params.file_paths = list(dict.fromkeys(file_paths))
+
+    def _save_params(self):
+        """Request a delayed save of the params. Successive requests are
+        coalesced into a single write."""
+
+        if self._params_saver is None or self._params_saver.param is not self.params:
+            self._flush_params()
+            self._params_saver = ParamSaver(self.params)
+        self._params_saver.request_save()
+
+    def _flush_params(self):
+        """Write pending params changes to disk."""
+
+        if self._params_saver is not None:
+            self._params_saver.flush()
 
     def _update_channels_param(self):
 
         if self.sel_channel.currentItem() is not None:
-            self.params.channels[self._get_current_file()] = self.sel_channel.currentItem().text()
-            self.params.save_parameters()
+            channel = self.sel_channel.currentItem().text()
+            if self.params.channels.get(self._get_current_file()) != channel:
+                self.params.set_channel(self._get_current_file(), channel)
+                self._save_params()
 
     def _update_roi_param(self, event):
         """Live update rois in the params object and the saved parameters file"""
         
-        rois = [list(x.flatten()) for x in self.viewer.layers['rois'].data]
-        rois = [[x.item() for x in y] for y in rois]
-        
-        self.params.rois[self._get_current_file()] = rois
-        self.params.save_parameters()
+        if self._roi_update_suspended:
+            return
+        rois = layer_to_rois(self.viewer.layers['rois'].data, self.ndim)
+        self.params.set_rois(self._get_current_file(), rois)
+        self._save_params()
 
     def _on_fixed_roi_size(self):
         """Display roi options when fixed roi size is selected"""
@@ -284,7 +555,12 @@ class ProjectWidget(QWidget):
         while event.type == 'mouse_move':
             yield
         if event.type == 'mouse_release':
-            self.viewer.layers['rois'].data = [np.around(x) for x in self.viewer.layers['rois'].data]
+            data = self.viewer.layers['rois'].data
+            rois = layer_to_rois(data, self.ndim)
+            if len(rois) == len(data):
+                self.viewer.layers['rois'].data = np.around(rois)
+            else:
+                self.viewer.layers['rois'].data = [np.around(x) for x in data]
     
     def _on_click_add_roi_fixed(self):
         """Add roi of fixed size to current roi layer"""
@@ -323,6 +599,8 @@ class ProjectWidget(QWidget):
         self.params = pr.create_project(project_path)
         os.chdir(project_path)
         self._on_check_copy_files()
+        self._on_check_lazy_images()
+        self._on_check_multiscale()
 
     def _on_click_select_export_folder(self):
         """Interactively select folder where to save annotations and rois"""
@@ -330,17 +608,94 @@ class ProjectWidget(QWidget):
         self.export_folder = Path(str(QFileDialog.getExistingDirectory(self, "Select folder for export",options=QFileDialog.DontUseNativeDialog)))
         self.display_export_folder.setText(self.export_folder.as_posix())
 
-    def _add_annotation_layer(self):
+    def _add_annotation_layer(self, annotation_future=None):
+        """Add the annotations layer, loading existing annotations if any.
 
-        self.viewer.add_labels(
-            data=np.zeros((self.viewer.layers[0].data.shape), dtype=np.uint16),
-            name='annotations'
-            )
+        Parameters
+        ----------
+        annotation_future: concurrent.futures.Future, optional
+            future of _read_annotations of the current file, if reading was
+            already started
+        """
+
+        annotation_file = self._create_annotation_filename_current()
+        with timers.timer('file_switch.read_annotations'):
+            if annotation_future is not None:
+                data = annotation_future.result()
+            else:
+                data = self._read_annotations(annotation_file)
+            if data is None:
+                data = annotations.create_annotations(
+                    annotation_file, self.viewer.layers[0].data.shape,
+                    dtype=annotations.label_dtype(self.params.max_label))
+        with timers.timer('file_switch.add_annotation_layer'):
+            if 'annotations' in [x.name for x in self.viewer.layers]:
+                layer = self.viewer.layers['annotations']
+                # keep the selected label, which napari clamps to the type of
+                # the data, by promoting the data if the label does not fit
+                layer.data = annotations.promote_labels(data, layer.selected_label)
+            else:
+                annotation_layer = self.viewer.add_labels(data=data, name='annotations')
+                # keep track of edits to only save modified annotations
+                annotation_layer.events.paint.connect(self._on_annotations_edited)
+                annotation_layer.events.data.connect(self._on_annotations_edited)
+                # undo and redo modify the data without emitting events
+                annotation_layer.undo = _call_after(annotation_layer.undo, self._on_annotations_edited)
+                annotation_layer.redo = _call_after(annotation_layer.redo, self._on_annotations_edited)
+                # paint and fill write labels through data_setitem
+                annotation_layer.data_setitem = _promote_before_setitem(annotation_layer)
+                # the colormap selection is set to the requested label before
+                # the label controls clamp it to the type of the data
+                annotation_layer.events.selected_label.connect(self._on_selected_label)
+                annotation_layer.colormap.events.selection.connect(self._on_selected_label)
+                annotation_layer.events.colormap.connect(self._on_annotation_colormap)
+        self.annotations_dirty = False
+
+    def _read_annotations(self, annotation_file):
+        """Read annotations once pending saves of the file are done. Returns
+        None if the file has no annotations."""
+
+        self.annotation_writer.wait(annotation_file)
+        if not annotations.has_annotations(annotation_file):
+            return None
+        data = annotations.read_annotations(annotation_file)
+        if isinstance(data, np.ndarray):
+            # hold labels in the smallest type, they are saved in that type
+            # once edited
+            data = annotations.compact_labels(data, self.params.max_label)
+        return data
+
+    def _on_selected_label(self, event=None):
+        """Promote the annotations to a larger type when the selected label
+        does not fit in their type."""
+
+        layer = self.viewer.layers['annotations']
+        label = getattr(event, 'value', None)
+        if label is None:
+            label = layer.selected_label
+        data = annotations.promote_labels(layer.data, label)
+        if data is not layer.data:
+            layer.data = data
+
+    def _on_annotation_colormap(self, event=None):
+        """Follow the label selection of a new colormap."""
+
+        colormap = self.viewer.layers['annotations'].colormap
+        colormap.events.selection.disconnect(self._on_selected_label)
+        colormap.events.selection.connect(self._on_selected_label)
+
+    def _on_annotations_edited(self, event=None):
+        """Mark annotations as modified"""
+
+        self.annotations_dirty = True
 
     def _add_roi_layer(self):
-        
+        """Add the rois layer if it does not exist yet."""
+
+        if 'rois' in [x.name for x in self.viewer.layers]:
+            return
         self.roi_layer = self.viewer.add_shapes(
-            ndim = self.viewer.layers[0].data.ndim,
+            ndim = len(self.viewer.layers[0].data.shape),
             name='rois', edge_color='red', face_color=[0,0,0,0], edge_width=10)
         
         # synchronize roi coordinates with those saved in the params
@@ -349,7 +704,7 @@ class ProjectWidget(QWidget):
         # convert rois to integers whenever drawing is over
         self.roi_layer.mouse_drag_callbacks.append(self._roi_to_int_on_mouse_release)
 
-    def _create_annotation_filename_current(self, filename=None, extension='_annot.tif'):
+    def _create_annotation_filename_current(self, filename=None, extension=None):
         """Create a path name based on the current file path stem.
         
         Parameters
@@ -357,7 +712,8 @@ class ProjectWidget(QWidget):
         filename: str or Path
             if None, use the current file name
         extension: str
-            suffix of the file name
+            suffix of the file name. If None, use the suffix of the project
+            annotation format
 
         Returns
         -------
@@ -368,16 +724,17 @@ class ProjectWidget(QWidget):
         #if self.params.project_path.joinpath('annotations') is None:
         #    self._on_click_select_project()
         if filename is None:
-            filename = Path(self.file_list.currentItem().text()).stem
-        else:
-            filename = Path(filename).stem
-        complete_name = self.params.project_path.joinpath('annotations', filename + extension)
+            filename = self.file_list.currentItem().text()
+        if extension is None:
+            extension = annotations.annotation_extension(self.params.annotation_format)
+        complete_name = pr.annotation_file_path(self.params.project_path, filename, extension)
 
         return complete_name
 
     def _on_click_load_project(self, event=None, project_path=None):
         """Load an existing project. The chosen folder needs to contain an
-        appropriately formatted Parameters.yml file."""
+        appropriately formatted Parameters.yml file. Loading does not
+        modify the project files."""
 
         # close existing project
         self.save_annotations()
@@ -391,18 +748,39 @@ class ProjectWidget(QWidget):
         os.chdir(project_path)
 
         self.params = pr.load_project(project_path)
-        for f in self.params.file_paths:
-            self.file_list.addItem(f)
-        if self.params.local_project:
-            self.check_copy_files.setChecked(True)
+
+        # fill the file list in a single batch, without the copies and
+        # parameter saves done when files are added
+        self.file_list.model().rowsInserted.disconnect(self._on_add_file)
+        try:
+            self.file_list.addItems(self.params.file_paths or [])
+        finally:
+            self.file_list.model().rowsInserted.connect(self._on_add_file)
+        self.check_copy_files.setChecked(self.params.local_project)
+        self.check_lazy_images.setChecked(self.params.lazy_images)
+        self.check_multiscale.setChecked(self.params.multiscale)
             
 
-    def save_annotations(self, event=None, filename=None):
-        """Save annotations in default location or in the specified location."""
+    def save_annotations(self, event=None, filename=None, wait=True):
+        """Save annotations in default location or in the specified location.
+        Annotations are only saved if they were modified since they were
+        loaded or last saved. Annotations are written by a background
+        writer, and if wait is False the method returns before the file is
+        written."""
 
+        if not self.annotations_dirty:
+            return
         if 'annotations' in [x.name for x in self.viewer.layers]:    
             data = self.viewer.layers['annotations'].data
-            imsave(self._create_annotation_filename_current(filename), data, compress=1, check_contrast=False)
+            if isinstance(data, np.ndarray):
+                # the layer can be edited while the copy is being written
+                data = data.copy()
+            annotation_file = self._create_annotation_filename_current(filename)
+            self.annotation_writer.submit(
+                annotation_file, _write_annotations, annotation_file, data, self.params.annotation_options())
+            if wait:
+                self.annotation_writer.wait(annotation_file)
+        self.annotations_dirty = False
 
     def _export_data(self, event=None):
         """Export cropped data of the images and the annotations using the rois."""
@@ -410,68 +788,61 @@ class ProjectWidget(QWidget):
         if self.export_folder is None:
             self._on_click_select_export_folder()
 
-        images_path = self.export_folder.joinpath(self._source_folder_name.text())
-        if not images_path.exists():
-            images_path.mkdir()
-        labels_path = self.export_folder.joinpath(self._target_folder_name.text())
-        if not labels_path.exists():
-            labels_path.mkdir()
-        
-        image_counter = 0
-        fieldnames = ['file_name', 'image_index', 'roi_index']
-        name_dict = []
-        for i in range(self.file_list.count()):
-            self.file_list.setCurrentRow(i)
-            for j in range(len(self.viewer.layers['rois'].data)):
-                limits = self.viewer.layers['rois'].data[j].astype(int)
-                annotations_roi = self.viewer.layers['annotations'].data.copy()
-                channel = self.params.channels[self._get_current_file()]
-                image_roi = self.viewer.layers[channel].data.copy()
-                
-                for n in range(self.ndim-2):
-                    annotations_roi = annotations_roi[limits[0,n]]
-                    image_roi = image_roi[limits[0,n]]
-
-                annotations_roi = annotations_roi[
-                    limits[0,-2]:limits[2,-2],
-                    limits[0,-1]:limits[1,-1]
-                ]
-                
-                image_roi = image_roi[
-                    limits[0,-2]:limits[2,-2],
-                    limits[0,-1]:limits[1,-1]
-                ]
-
-                imsave(images_path.joinpath(f'{self._source_name.text()}{image_counter}.tif'), image_roi, check_contrast=False)
-                imsave(labels_path.joinpath(f'{self._target_name.text()}{image_counter}.tif'), annotations_roi, check_contrast=False)
-                image_counter += 1
-                temp_dict = {'file_name': self.file_list.currentItem().text(), 'image_index': image_counter, 'roi_index': j}
-                name_dict.append(temp_dict)
-        
-        # export information for rois e.g. from which image they were extracted
-        with open(self.export_folder.joinpath('rois_infos.csv'), 'w', encoding='UTF8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(name_dict)
+        # make sure the annotations of all files are on disk
+        self.save_annotations()
+        self.annotation_writer.flush()
+
+        overlaps = overlap_report(self.params)
+        if len(overlaps) > 0:
+            from napari.utils.notifications import show_warning
+            show_warning(f"{len(overlaps)} pairs of rois overlap, see rois_overlaps.csv in the export folder")
+
+        export.export_project(
+            project=self.params,
+            export_folder=self.export_folder,
+            source_folder_name=self._source_folder_name.text(),
+            source_name=self._source_name.text(),
+            target_folder_name=self._target_folder_name.text(),
+            target_name=self._target_name.text(),
+            export_format=self.combo_export_format.currentText(),
+            incremental=self.check_incremental_export.isChecked(),
+            overlaps=overlaps)
 
     def _on_select_file(self, current_item, previous_item):
         """Update the viewer with the selected file and its corresponding
         annotations and rois."""
 
+        with timers.timer('file_switch.total'):
+            self._select_file(current_item, previous_item)
+
+    def _select_file(self, current_item, previous_item):
+
         # when switching from an open file, save the annatations of the previous file
+        # in the background
         if previous_item is not None:
-            self.save_annotations(filename=previous_item.text())
+            with timers.timer('file_switch.save_annotations'):
+                self.save_annotations(filename=previous_item.text(), wait=False)
         
         self.sel_channel.clear()
 
+        # read the annotations on a worker while the image is opened. The
+        # image itself is read on this thread (or taken from the prefetch
+        # cache) and the layer setup then waits for the annotations
+        annotation_future = None
+        if current_item is not None:
+            annotation_future = self._io_executor.submit(
+                self._read_annotations, self._create_annotation_filename_current())
+
         # open file and add annotations and roi layers. If no image could 
         # be opened because file list is empty, do nothing.
         success = self.open_file()
         if not success:
             return
+        self._prefetch_neighbours()
 
-        self._add_annotation_layer()
-        self._add_roi_layer()
+        self._add_annotation_layer(annotation_future)
+        with timers.timer('file_switch.add_roi_layer'):
+            self._add_roi_layer()
 
         # create channel choices if open lead to multiple layers opening
         for ch in self.viewer.layers:
@@ -479,20 +850,47 @@ class ProjectWidget(QWidget):
                 self.sel_channel.addItem(ch.name)
         
         # if channel selection exists in params, select it
-        if self.params.channels[current_item.text()] is not None:
-            self.sel_channel.setCurrentItem(self.sel_channel.findItems(self.params.channels[current_item.text()], Qt.MatchExactly)[0])
-        else:
-            self.sel_channel.setCurrentRow(0)
-        
-        # add annoations if any exist
-        if self._create_annotation_filename_current().exists():
-            self.viewer.layers['annotations'].data = imread(self._create_annotation_filename_current())
+        with timers.timer('file_switch.select_channel'):
+            if self.params.channels.get(current_item.text()) is not None:
+                self.sel_channel.setCurrentItem(self.sel_channel.findItems(self.params.channels[current_item.text()], Qt.MatchExactly)[0])
+            else:
+                self.sel_channel.setCurrentRow(0)
         
-        # add rois if any exist
-        if current_item.text() in self.params.rois.keys():
-            rois = self.params.rois[current_item.text()]
-            rois = [np.array(x).reshape(4,self.ndim) for x in rois]
-            self.viewer.layers['rois'].add_rectangles(rois, edge_color='r', edge_width=10)
+        # replace rois by those of the file, without updating the params
+        rois = self.params.rois.get(current_item.text())
+        roi_layer = self.viewer.layers['rois']
+        with timers.timer('file_switch.add_rois'), self._suspend_roi_update():
+            if len(roi_layer.data) > 0:
+                roi_layer.data = []
+            if rois is not None and len(rois) > 0:
+                roi_layer.add_rectangles(rois, edge_color='r', edge_width=10)
+
+def _call_after(func, callback):
+
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        callback()
+        return result
+    return wrapper
+
+def _promote_before_setitem(layer):
+    """Wrap data_setitem of a labels layer to promote its data to a larger
+    type before writing labels that do not fit in its type."""
+
+    data_setitem = layer.data_setitem
+
+    def wrapper(indices, value, *args, **kwargs):
+        if np.size(value) > 0:
+            data = annotations.promote_labels(layer.data, int(np.max(value)))
+            if data is not layer.data:
+                layer.data = data
+        return data_setitem(indices, value, *args, **kwargs)
+    return wrapper
+
+def _write_annotations(annotation_file, data, options):
+
+    with timers.timer('save.annotations'):
+        annotations.write_annotations(annotation_file, data, **options)
 
 class VHGroup():
     """Group box with specific layout
@@ -0,0 +1,330 @@
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import tifffile
+
+from .export import open_array, close_array, TiffPlanes
+
+PYRAMID_FOLDER = 'pyramids'
+# formats that can be opened without reading them entirely
+PYRAMID_SOURCE_FORMATS = ['.tif', '.tiff', '.zarr']
+
+
+def pyramid_path(project_path, file_path):
+    """
+    Path of the cached pyramid of an image file. The name contains hashes
+    of the absolute path of the file and of its size and modification time,
+    so that a modified file gets a new pyramid.
+
+    Parameters
+    ----------
+    project_path : str or Path
+        path where the project is saved
+    file_path : str or Path
+        path of the image file
+
+    Returns
+    -------
+    path : Path or None
+        path of the pyramid, None if the file does not exist
+    """
+
+    file_path = Path(file_path)
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return Path(project_path).joinpath(PYRAMID_FOLDER, _pyramid_prefix(file_path) + _hash(
+        f'{stat.st_size}_{stat.st_mtime_ns}') + '.zarr')
+
+def build_pyramid(data, path, min_size=512, chunk_size=256):
+    """
+    Build a multiscale pyramid of an image and save it as one zarr array
+    per level, level 0 being the image itself. Each level halves the last
+    two dimensions of the previous one by averaging blocks of 2x2 pixels.
+    The image is copied and downsampled by strips of rows so that only
+    a few strips are held in memory. The pyramid is written in a temporary
+    folder which then replaces any existing pyramid.
+
+    Parameters
+    ----------
+    data : array-like or TiffPage
+        image whose last two dimensions are y, x, e.g. opened with
+        export.open_array, or a single 2D tiff page, decoded strip by strip
+        or tile by tile
+    path : str or Path
+        path of the pyramid folder
+    min_size : int
+        levels are added until both of the last two dimensions are at most
+        min_size
+    chunk_size : int
+        size of the chunks in the last two dimensions
+
+    Returns
+    -------
+    levels : list of zarr arrays
+        levels of the pyramid, from the full resolution image
+    """
+
+    path = Path(path)
+    temp_path = path.with_name(path.name + '.tmp')
+    if temp_path.exists():
+        shutil.rmtree(temp_path)
+    temp_path.mkdir(parents=True)
+    try:
+        level = _create_level(temp_path.joinpath('0'), data.shape, data.dtype, chunk_size)
+        for index, start, strip in _iter_strips(data, 2 * chunk_size):
+            level[index + (slice(start, start + len(strip)),)] = strip
+
+        level_index = 1
+        while max(level.shape[-2:]) > min_size:
+            shape = tuple(level.shape[:-2]) + tuple((s + 1) // 2 for s in level.shape[-2:])
+            next_level = _create_level(temp_path.joinpath(str(level_index)), shape, level.dtype, chunk_size)
+            for index, start, strip in _iter_strips(level, 2 * chunk_size):
+                next_level[index + (slice(start // 2, start // 2 + (len(strip) + 1) // 2),)] = _downsample(strip)
+            level = next_level
+            level_index += 1
+
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(temp_path, path)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+    return open_pyramid(path)
+
+def open_pyramid(path):
+    """
+    Open the levels of a pyramid saved by build_pyramid.
+
+    Parameters
+    ----------
+    path : str or Path
+        path of the pyramid folder
+
+    Returns
+    -------
+    levels : list of zarr arrays or None
+        levels of the pyramid, None if there is no complete pyramid at path
+    """
+
+    import zarr
+
+    path = Path(path)
+    if not path.is_dir():
+        return None
+    levels = sorted((p for p in path.iterdir() if p.name.isdigit()), key=lambda p: int(p.name))
+    return [zarr.open_array(p.as_posix(), mode='r') for p in levels]
+
+class PyramidCache:
+    """
+    Cache of multiscale pyramids of large images in the pyramids folder of
+    a project. Pyramids are built on a worker thread when first requested
+    and are rebuilt when the image file is modified. Only tiff and zarr
+    files, which can be read by strips, are considered, and rgb images are
+    skipped.
+
+    Parameters
+    ----------
+    project_path : str or Path
+        path where the project is saved
+    min_size : int
+        pyramids are only built for images with one of the last two
+        dimensions larger than min_size
+    n_workers : int
+        number of threads used to build pyramids
+    """
+
+    def __init__(self, project_path, min_size=4096, n_workers=1):
+        self.project_path = Path(project_path)
+        self.min_size = min_size
+        self._futures = {}
+        self._skipped = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=n_workers)
+
+    def get(self, file_path):
+        """Get the pyramid of a file if it is already built.
+
+        Parameters
+        ----------
+        file_path : str or Path
+            path of the image file
+
+        Returns
+        -------
+        levels : list of zarr arrays or None
+            levels of the pyramid, None if it is not built
+        """
+
+        path = pyramid_path(self.project_path, file_path)
+        if path is None:
+            return None
+        with self._lock:
+            future = self._futures.get(path)
+        if future is not None and not future.done():
+            return None
+        return open_pyramid(path)
+
+    def request(self, file_path):
+        """Build the pyramid of a file in the background if it does not
+        exist yet and the file is large enough.
+
+        Parameters
+        ----------
+        file_path : str or Path
+            path of the image file
+
+        Returns
+        -------
+        future : concurrent.futures.Future or None
+            future of the levels of the pyramid, which is already done if
+            the pyramid exists. None if the file is not supported.
+        """
+
+        if Path(file_path).suffix.lower() not in PYRAMID_SOURCE_FORMATS:
+            return None
+        path = pyramid_path(self.project_path, file_path)
+        if path is None:
+            return None
+        with self._lock:
+            future = self._futures.get(path)
+            if future is None:
+                future = Future()
+                if path in self._skipped:
+                    future.set_result(None)
+                elif path.is_dir():
+                    future.set_result(open_pyramid(path))
+                else:
+                    future = self._executor.submit(self._build, file_path, path)
+                    self._futures[path] = future
+            return future
+
+    def close(self):
+        """Stop building pyramids. Pyramids being built are completed."""
+
+        self._executor.shutdown(wait=False)
+
+    def _build(self, file_path, path):
+
+        data = None
+        try:
+            data = _open_tiff_page(file_path)
+            if data is None:
+                data = open_array(file_path)
+            rgb = data.ndim > 2 and data.shape[-1] in (3, 4)
+            if rgb or max(data.shape[-2:]) <= self.min_size:
+                with self._lock:
+                    self._skipped.add(path)
+                return None
+            levels = build_pyramid(data, path)
+            # remove pyramids of previous versions of the file
+            for old_path in path.parent.glob(_pyramid_prefix(file_path) + '*'):
+                if old_path != path and not old_path.name.endswith('.tmp'):
+                    shutil.rmtree(old_path, ignore_errors=True)
+            return levels
+        finally:
+            if isinstance(data, tifffile.TiffPage):
+                data.parent.close()
+            else:
+                close_array(data)
+            with self._lock:
+                self._futures.pop(path, None)
+
+def _open_tiff_page(file_path):
+    """Open the page of a single page 2D tiff file that cannot be
+    memory-mapped, e.g. a compressed one, which export.open_array would
+    decode entirely. Returns None for other files."""
+
+    if Path(file_path).suffix.lower() not in ['.tif', '.tiff']:
+        return None
+    tif = tifffile.TiffFile(file_path)
+    series = tif.series[0]
+    page = series.pages[0]
+    if (len(series.pages) == 1 and page.ndim == 2 and page.shape == tuple(series.shape)
+            and not page.is_memmappable):
+        return page
+    tif.close()
+    return None
+
+def _create_level(path, shape, dtype, chunk_size):
+
+    import zarr
+
+    chunks = (1,) * (len(shape) - 2) + tuple(min(s, chunk_size) for s in shape[-2:])
+    return zarr.open_array(path.as_posix(), mode='w', shape=shape, chunks=chunks, dtype=dtype)
+
+def _iter_strips(data, strip_size):
+    """Yield (plane index, first row, strip) for strips of rows of each
+    plane. Tiff pages are read once per plane, single tiff pages are
+    decoded strip by strip or tile by tile."""
+
+    if isinstance(data, tifffile.TiffPage):
+        for start, strip in _iter_page_strips(data, strip_size):
+            yield (), start, strip
+        return
+    for index in np.ndindex(*data.shape[:-2]):
+        plane = data
+        if isinstance(data, TiffPlanes):
+            plane = np.asarray(data[index]) if index else np.asarray(data[...])
+            index_in_plane = ()
+        else:
+            index_in_plane = index
+        for start in range(0, data.shape[-2], strip_size):
+            strip = np.asarray(plane[index_in_plane + (slice(start, start + strip_size),)])
+            yield index, start, strip
+
+def _iter_page_strips(page, strip_size):
+    """Yield (first row, strip) for strips of rows of a 2D tiff page. The
+    strips or tiles of the page are decoded in order into a buffer of
+    strip_size rows plus one segment, so the page is never decoded
+    entirely."""
+
+    height, width = page.shape
+    segment_rows = min(page.tilelength if page.is_tiled else page.rowsperstrip, height)
+    buffer = np.zeros((strip_size + segment_rows, width), dtype=page.dtype)
+    start = 0
+    for segment, (_, _, y, x, _), _ in page.segments():
+        # segments come by increasing rows, the strip is complete once a
+        # segment starts after it
+        while y >= start + strip_size:
+            yield start, buffer[:strip_size].copy()
+            buffer[:segment_rows] = buffer[strip_size:]
+            buffer[segment_rows:] = 0
+            start += strip_size
+        if segment is None:
+            continue
+        rows = min(segment.shape[1], height - y)
+        cols = min(segment.shape[2], width - x)
+        buffer[y - start:y - start + rows, x:x + cols] = segment[0, :rows, :cols, 0]
+    while start < height:
+        yield start, buffer[:min(strip_size, height - start)].copy()
+        buffer[:segment_rows] = buffer[strip_size:]
+        buffer[segment_rows:] = 0
+        start += strip_size
+
+def _downsample(strip):
+    """Average blocks of 2x2 pixels, repeating the last row and column of
+    odd sizes."""
+
+    pad = [(0, 0)] * (strip.ndim - 2) + [(0, s % 2) for s in strip.shape[-2:]]
+    padded = np.pad(strip, pad, mode='edge')
+    shape = padded.shape[:-2] + (padded.shape[-2] // 2, 2, padded.shape[-1] // 2, 2)
+    mean = padded.reshape(shape).mean(axis=(-3, -1))
+    if np.issubdtype(strip.dtype, np.integer):
+        mean = np.round(mean)
+    return mean.astype(strip.dtype)
+
+def _pyramid_prefix(file_path):
+
+    file_path = Path(file_path)
+    return f'{file_path.stem}_{_hash(file_path.absolute().as_posix())}_'
+
+def _hash(text):
+
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
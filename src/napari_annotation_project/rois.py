@@ -0,0 +1,248 @@
+import numpy as np
+
+
+def rois_to_array(rois, ndim=None):
+    """
+    Convert the rois of a file to a single array of rectangle corners.
+
+    Parameters
+    ----------
+    rois : array-like
+        rois as flat lists of coordinates, as stored on disk, as a list of
+        4 x ndim arrays, as in the shapes layer, or as an N x 4 x ndim array
+    ndim : int, optional
+        number of dimensions, used when there is no roi. If None, empty
+        rois have 0 dimensions.
+
+    Returns
+    -------
+    rois : array
+        N x 4 x ndim float array
+
+    """
+
+    if isinstance(rois, np.ndarray) and rois.ndim == 3 and rois.dtype == float:
+        return rois
+    rois = np.asarray(rois, dtype=float)
+    if rois.size == 0:
+        return np.zeros((0, 4, ndim if ndim is not None else 0))
+    return rois.reshape(len(rois), 4, -1)
+
+def rois_to_list(rois):
+    """
+    Convert the rois of a file to flat lists of coordinates, as stored on
+    disk.
+
+    Parameters
+    ----------
+    rois : array
+        N x 4 x ndim array of rois
+
+    Returns
+    -------
+    rois : list of list
+        list of 4 * ndim coordinates for each roi
+
+    """
+
+    if len(rois) == 0:
+        return []
+    rois = np.asarray(rois)
+    return rois.reshape(len(rois), -1).tolist()
+
+def layer_to_rois(shapes, ndim):
+    """
+    Convert the data of a shapes layer to rois. Only shapes with 4 vertices
+    are kept.
+
+    Parameters
+    ----------
+    shapes : list of array
+        data of the shapes layer
+    ndim : int
+        number of dimensions of the layer
+
+    Returns
+    -------
+    rois : array
+        N x 4 x ndim float array
+
+    """
+
+    shapes = [x for x in shapes if len(x) == 4]
+    if len(shapes) == 0:
+        return np.zeros((0, 4, ndim))
+    return np.stack(shapes).astype(float, copy=False)
+
+class RoiIndex:
+    """
+    Spatial index of the rois of a file. Rois are grouped by plane, i.e. by
+    their coordinates along the leading dimensions, and sorted by their
+    first row within each plane, so that queries only test the rois whose
+    rows can intersect the query.
+
+    Parameters
+    ----------
+    rois : array-like
+        rois of the file, see rois_to_array
+    """
+
+    def __init__(self, rois):
+        self.rois = rois_to_array(rois)
+        corners = self.rois[:, :, -2:]
+        self.mins = corners.min(axis=1)
+        self.maxs = corners.max(axis=1)
+        self._groups = {}
+        if len(self.rois) == 0:
+            return
+        planes, inverse = np.unique(self.rois[:, 0, :-2], axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        for k, plane in enumerate(planes):
+            indices = np.flatnonzero(inverse == k)
+            indices = indices[np.argsort(self.mins[indices, 0], kind='stable')]
+            height = (self.maxs[indices, 0] - self.mins[indices, 0]).max()
+            self._groups[tuple(plane.tolist())] = (indices, self.mins[indices, 0], height)
+
+    def __len__(self):
+        return len(self.rois)
+
+    @property
+    def planes(self):
+        """Planes containing rois."""
+
+        return list(self._groups)
+
+    def on_plane(self, plane=()):
+        """
+        Find the rois of a plane.
+
+        Parameters
+        ----------
+        plane : tuple
+            coordinates along the leading dimensions, empty for 2D images
+
+        Returns
+        -------
+        indices : array
+            sorted indices of the rois
+        """
+
+        group = self._groups.get(tuple(float(p) for p in plane))
+        if group is None:
+            return np.zeros(0, dtype=int)
+        return np.sort(group[0])
+
+    def in_bbox(self, bbox_min, bbox_max, plane=()):
+        """
+        Find the rois of a plane intersecting a rectangle.
+
+        Parameters
+        ----------
+        bbox_min : array-like
+            first row and column of the rectangle
+        bbox_max : array-like
+            last row and column of the rectangle
+        plane : tuple
+            coordinates along the leading dimensions, empty for 2D images
+
+        Returns
+        -------
+        indices : array
+            sorted indices of the rois
+        """
+
+        return self._query(np.asarray(bbox_min, dtype=float), np.asarray(bbox_max, dtype=float), plane, strict=True)
+
+    def at_point(self, point):
+        """
+        Find the rois containing a point, borders included.
+
+        Parameters
+        ----------
+        point : array-like
+            coordinates of the point, with the same dimensions as the rois
+
+        Returns
+        -------
+        indices : array
+            sorted indices of the rois
+        """
+
+        point = np.asarray(point, dtype=float)
+        return self._query(point[-2:], point[-2:], tuple(point[:-2]), strict=False)
+
+    def overlaps(self):
+        """
+        Find all pairs of rois of the same plane whose areas intersect.
+
+        Returns
+        -------
+        pairs : list of tuple
+            (index1, index2, intersection area) with index1 < index2
+        """
+
+        pairs = []
+        for indices, row_mins, _ in self._groups.values():
+            # candidates of each roi start below it in the sorted order and
+            # end at the first roi starting after its last row
+            ends = np.searchsorted(row_mins, self.maxs[indices, 0], side='left')
+            for k in range(len(indices)):
+                others = indices[k+1:ends[k]]
+                if len(others) == 0:
+                    continue
+                i = indices[k]
+                size = (np.minimum(self.maxs[i], self.maxs[others]) -
+                        np.maximum(self.mins[i], self.mins[others]))
+                keep = np.all(size > 0, axis=1)
+                for j, area in zip(others[keep], np.prod(size[keep], axis=1)):
+                    pairs.append((int(min(i, j)), int(max(i, j)), float(area)))
+        return sorted(pairs)
+
+    def _query(self, bbox_min, bbox_max, plane, strict):
+
+        group = self._groups.get(tuple(float(p) for p in plane))
+        if group is None:
+            return np.zeros(0, dtype=int)
+        indices, row_mins, height = group
+        start = np.searchsorted(row_mins, bbox_min[0] - height, side='left')
+        stop = np.searchsorted(row_mins, bbox_max[0], side='right')
+        candidates = indices[start:stop]
+        mins = self.mins[candidates]
+        maxs = self.maxs[candidates]
+        if strict:
+            keep = np.all((mins < bbox_max) & (maxs > bbox_min), axis=1)
+        else:
+            keep = np.all((mins <= bbox_max) & (maxs >= bbox_min), axis=1)
+        return np.sort(candidates[keep])
+
+def overlap_report(project):
+    """
+    List the overlapping rois of all files of a project, e.g. to find
+    duplicated rois before exporting training data.
+
+    Parameters
+    ----------
+    project : Param
+        project parameters
+
+    Returns
+    -------
+    report : list of dict
+        one dict per pair of overlapping rois with the file_name, the
+        roi_index and other_index of the rois, the intersection area, the
+        intersection over union (iou) and the fraction of the smaller roi
+        covered (overlap)
+    """
+
+    report = []
+    for file_name in list(project.rois):
+        index = project.roi_index(file_name)
+        areas = np.prod(index.maxs - index.mins, axis=1)
+        for i, j, area in index.overlaps():
+            report.append({
+                'file_name': file_name, 'roi_index': i, 'other_index': j,
+                'area': area,
+                'iou': area / (areas[i] + areas[j] - area),
+                'overlap': area / min(areas[i], areas[j]),
+            })
+    return report
@@ -0,0 +1,125 @@
+import dataclasses
+import json
+import sqlite3
+from pathlib import Path
+
+from .rois import rois_to_array, rois_to_list
+
+DB_NAME = 'Parameters.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS project (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    file_path TEXT PRIMARY KEY, position INTEGER, channel TEXT);
+CREATE TABLE IF NOT EXISTS rois (
+    file_path TEXT, roi_index INTEGER, coords TEXT);
+CREATE INDEX IF NOT EXISTS files_position ON files(position);
+CREATE INDEX IF NOT EXISTS rois_file_path ON rois(file_path, roi_index);
+"""
+
+def save_sqlite(param, db_path, full=False):
+    """
+    Save parameters in an sqlite database. Only the rows of files that
+    changed since the last save are updated, unless full is True.
+
+    Parameters
+    ----------
+    param : Param
+        parameters to save
+    db_path : str or Path
+        path of the database file
+    full : bool
+        if True, rewrite all rows
+    """
+
+    changed = param.pop_changed_files()
+    file_paths = [Path(f).as_posix() if not isinstance(f, str) else f for f in (param.file_paths or [])]
+    project_path = param.project_path
+    if project_path is not None and not isinstance(project_path, str):
+        project_path = project_path.as_posix()
+
+    con = sqlite3.connect(db_path)
+    try:
+        with con:
+            con.executescript(_SCHEMA)
+            # per-file parameters are stored in their own tables, all other
+            # parameters as key/value pairs
+            settings = {f.name: getattr(param, f.name) for f in dataclasses.fields(param)
+                        if f.name not in ['file_paths', 'channels', 'rois']}
+            settings['project_path'] = project_path
+            settings['file_paths_none'] = param.file_paths is None
+            con.executemany(
+                "INSERT OR REPLACE INTO project VALUES (?, ?)",
+                [(k, json.dumps(v)) for k, v in settings.items()])
+
+            stored = param._stored_file_paths
+            if full or stored is None:
+                stored = [x[0] for x in con.execute("SELECT file_path FROM files ORDER BY position")]
+            if full:
+                changed = set(file_paths)
+            if stored != file_paths:
+                # the file list changed: remove deleted files, add new ones
+                # and update positions
+                removed = [(f,) for f in set(stored) - set(file_paths)]
+                con.executemany("DELETE FROM files WHERE file_path = ?", removed)
+                con.executemany("DELETE FROM rois WHERE file_path = ?", removed)
+                changed |= set(file_paths) - set(stored)
+                con.executemany(
+                    "INSERT INTO files (file_path, position) VALUES (?, ?) "
+                    "ON CONFLICT(file_path) DO UPDATE SET position = excluded.position",
+                    [(f, i) for i, f in enumerate(file_paths)])
+
+            # rois and channels of files outside the file list, e.g. set
+            # while a file is being copied, are not stored
+            in_project = set(file_paths)
+            con.executemany("DELETE FROM rois WHERE file_path = ?", [(f,) for f in changed if f not in in_project])
+            changed = [f for f in changed if f in in_project and (f in param.channels or f in param.rois)]
+            con.executemany(
+                "UPDATE files SET channel = ? WHERE file_path = ?",
+                [(param.channels.get(f), f) for f in changed])
+            con.executemany("DELETE FROM rois WHERE file_path = ?", [(f,) for f in changed])
+            con.executemany(
+                "INSERT INTO rois VALUES (?, ?, ?)",
+                [(f, i, json.dumps(roi)) for f in changed
+                 for i, roi in enumerate(rois_to_list(param.rois.get(f, [])))])
+    finally:
+        con.close()
+    param._stored_file_paths = file_paths
+
+def load_sqlite(db_path):
+    """
+    Load parameters from an sqlite database.
+
+    Parameters
+    ----------
+    db_path : str or Path
+        path of the database file
+
+    Returns
+    -------
+    documents : dict
+        parameters as found in a Parameters.yml file
+    """
+
+    con = sqlite3.connect(db_path)
+    try:
+        documents = {k: json.loads(v) for k, v in con.execute("SELECT key, value FROM project")}
+        file_paths = []
+        channels = {}
+        rois = {}
+        for f, channel in con.execute("SELECT file_path, channel FROM files ORDER BY position"):
+            file_paths.append(f)
+            channels[f] = channel
+            rois[f] = []
+        for f, coords in con.execute("SELECT file_path, coords FROM rois ORDER BY file_path, roi_index"):
+            # ignore rois left by files that are not part of the project
+            if f in rois:
+                rois[f].append(json.loads(coords))
+    finally:
+        con.close()
+    rois = {f: rois_to_array(r) for f, r in rois.items()}
+
+    if documents.pop('file_paths_none', False) and len(file_paths) == 0:
+        file_paths = None
+    documents.update({'file_paths': file_paths, 'channels': channels, 'rois': rois})
+    return documents
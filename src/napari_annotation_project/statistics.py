@@ -0,0 +1,169 @@
+import json
+import os
+from pathlib import Path
+import numpy as np
+
+from .parameters import Param
+from . import project as pr
+from .annotations import annotation_extension, has_annotations
+from .export import imap_jobs, open_array, close_array, crop_roi
+from .manifest import file_stat, save_json
+from .rois import rois_to_list
+from .timing import timers
+
+STATISTICS_NAME = 'label_statistics.json'
+
+
+@timers.timed('statistics.total')
+def label_statistics(project, n_workers=None, use_cache=True):
+    """
+    Count the pixels of each label in the annotations of a project, in
+    each file and each roi. Annotation files are scanned in parallel.
+    Results are cached in label_statistics.json in the project folder,
+    keyed by the size and modification time of the annotation files and
+    the rois, so that only changed files are scanned again.
+
+    Parameters
+    ----------
+    project : Param or str or Path
+        project object or path where the project is saved
+    n_workers : int, optional
+        number of processes to use. Defaults to the number of CPUs.
+    use_cache : bool
+        if False, scan all files and do not update the cache
+
+    Returns
+    -------
+    statistics : dict
+        for each file, a dict with:
+        annotated: False if the file has no annotations
+        counts: number of pixels of each label, indexed by label
+        coverage: fraction of the pixels with a non-zero label
+        roi_counts: counts of each roi
+        roi_fractions: fraction of the pixels of each label in each roi
+
+    """
+
+    if not isinstance(project, Param):
+        project = pr.load_project(project)
+    project_path = Path(project.project_path)
+    cache_path = project_path.joinpath(STATISTICS_NAME)
+
+    cache = load_statistics_cache(cache_path) if use_cache else {}
+    extension = annotation_extension(project.annotation_format)
+    entries = {}
+    jobs = []
+    for f in (project.file_paths or []):
+        annotation_path = pr.annotation_file_path(project_path, f, extension)
+        stat = file_stat(annotation_path)
+        entry = {'stat': list(stat) if stat is not None else None,
+                 'rois': rois_to_list(project.rois.get(f, []))}
+        cached = cache.get(f)
+        if cached is not None and cached['stat'] == entry['stat'] and cached['rois'] == entry['rois']:
+            entry['statistics'] = cached['statistics']
+        else:
+            jobs.append({'file_name': f, 'annotation_path': annotation_path, 'rois': entry['rois']})
+        entries[f] = entry
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    for job, statistics in zip(jobs, imap_jobs(file_label_statistics, jobs, n_workers)):
+        entries[job['file_name']]['statistics'] = statistics
+
+    if use_cache and len(jobs) > 0:
+        save_json(cache_path, {'files': entries})
+
+    return {f: entry['statistics'] for f, entry in entries.items()}
+
+def file_label_statistics(job):
+    """
+    Count the pixels of each label in the annotations of one file. Planes
+    are read one at a time.
+
+    Parameters
+    ----------
+    job : dict
+        dict with annotation_path and rois as flat coordinates lists
+
+    Returns
+    -------
+    statistics : dict
+        see label_statistics
+
+    """
+
+    if not has_annotations(job['annotation_path']):
+        return {'annotated': False, 'counts': [], 'coverage': 0.0,
+                'roi_counts': [[] for _ in job['rois']], 'roi_fractions': [[] for _ in job['rois']]}
+
+    data = open_array(job['annotation_path'])
+    try:
+        counts = np.zeros(0, dtype=np.int64)
+        for index in np.ndindex(*data.shape[:-2]):
+            counts = _add_counts(counts, _bincount(data[index] if index else data[...]))
+
+        roi_counts = []
+        roi_fractions = []
+        for roi in job['rois']:
+            limits = np.array(roi).reshape(4, data.ndim).astype(int)
+            crop = crop_roi(data, limits)
+            count = _bincount(crop)
+            roi_counts.append(count.tolist())
+            roi_fractions.append((count / max(crop.size, 1)).tolist())
+    finally:
+        close_array(data)
+
+    total = counts.sum()
+    return {
+        'annotated': True,
+        'counts': counts.tolist(),
+        'coverage': float(1 - counts[0] / total) if total > 0 else 0.0,
+        'roi_counts': roi_counts,
+        'roi_fractions': roi_fractions,
+    }
+
+def total_label_counts(statistics):
+    """
+    Sum the pixel counts of each label over all files.
+
+    Parameters
+    ----------
+    statistics : dict
+        statistics as returned by label_statistics
+
+    Returns
+    -------
+    counts : array
+        number of pixels of each label, indexed by label
+    """
+
+    counts = np.zeros(0, dtype=np.int64)
+    for stats in statistics.values():
+        counts = _add_counts(counts, np.asarray(stats['counts'], dtype=np.int64))
+    return counts
+
+def load_statistics_cache(cache_path):
+    """Load cached statistics by file, empty if the cache is missing or
+    cannot be read."""
+
+    try:
+        with open(cache_path, encoding='UTF8') as f:
+            return json.load(f)['files']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def _bincount(data):
+
+    data = np.asarray(data).ravel()
+    if data.dtype.kind not in 'ui' or data.dtype.itemsize > np.dtype(np.intp).itemsize:
+        data = data.astype(np.intp)
+    return np.bincount(data)
+
+def _add_counts(counts, other):
+
+    if len(other) > len(counts):
+        counts, other = other.astype(np.int64), counts
+    else:
+        counts = counts.copy()
+    counts[:len(other)] += other
+    return counts
@@ -0,0 +1,140 @@
+import csv
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TimerRegistry:
+    """
+    Opt-in registry of the durations of named stages, e.g. the steps of
+    switching files in the project widget. Timers do nothing until the
+    registry is enabled.
+
+    Recorded stages can be read from records or summary, passed to hooks
+    as they are recorded, and dumped with to_csv and to_json.
+
+    Parameters
+    ----------
+    enabled: bool
+        if True, start recording immediately
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def enable(self):
+        """Start recording."""
+
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording. Existing records are kept."""
+
+        self.enabled = False
+
+    def clear(self):
+        """Remove all records."""
+
+        with self._lock:
+            self.records = []
+
+    def add_hook(self, hook):
+        """Call hook(record) each time a stage is recorded. Hooks are called
+        from the thread running the stage."""
+
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """Remove a hook added with add_hook."""
+
+        self.hooks.remove(hook)
+
+    @contextmanager
+    def timer(self, name, **info):
+        """Record the duration of the enclosed block under name.
+
+        Parameters
+        ----------
+        name : str
+            name of the stage, e.g. 'file_switch.open_image'
+        info : dict
+            additional information stored with the record, e.g. a file name
+        """
+
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            record = {'name': name, 'start': start, 'duration': duration,
+                      'thread': threading.current_thread().name, **info}
+            with self._lock:
+                self.records.append(record)
+            for hook in list(self.hooks):
+                hook(record)
+
+    def timed(self, name):
+        """Decorator recording the duration of each call of a function."""
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+        Summarize records by stage.
+
+        Returns
+        -------
+        summary : dict
+            for each stage name, a dict with count, total, mean and max
+            durations in seconds
+        """
+
+        with self._lock:
+            records = list(self.records)
+        summary = {}
+        for record in records:
+            stats = summary.setdefault(record['name'], {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += record['duration']
+            stats['max'] = max(stats['max'], record['duration'])
+        for stats in summary.values():
+            stats['mean'] = stats['total'] / stats['count']
+        return summary
+
+    def to_csv(self, path):
+        """Write all records to a csv file, one row per record."""
+
+        with self._lock:
+            records = list(self.records)
+        fieldnames = ['name', 'start', 'duration', 'thread']
+        for record in records:
+            fieldnames += [k for k in record if k not in fieldnames]
+        with open(path, 'w', encoding='UTF8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(records)
+
+    def to_json(self, path):
+        """Write all records and their summary to a json file."""
+
+        with self._lock:
+            records = list(self.records)
+        with open(path, 'w', encoding='UTF8') as f:
+            json.dump({'records': records, 'summary': self.summary()}, f, indent=2, default=str)
+
+# registry used to instrument the plugin
+timers = TimerRegistry()